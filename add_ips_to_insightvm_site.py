@@ -1,55 +1,40 @@
 # filename: add_ips_to_insightvm_site.py
-import os
 import requests
 import json
 import logging
-from requests.auth import HTTPBasicAuth
-from urllib3.exceptions import InsecureRequestWarning
-
-# Set up logging
-logging.basicConfig(level=logging.INFO)
-
-# Suppress only the single InsecureRequestWarning from urllib3 needed
-requests.packages.urllib3.disable_warnings(category=InsecureRequestWarning)
-
-def add_ips_to_insightvm_site(ips, site_id):
-    # Environment variables
-    username = os.getenv('INSIGHTVM_USERNAME')
-    password = os.getenv('INSIGHTVM_PASSWORD')
-    base_url = os.getenv('INSIGHTVM_BASE_URL')
+from insightvm_batches import send_in_batches
+from http_client import get_client
+from audit_log import bounded
+from log_config import configure_logging
 
+def add_ips_to_insightvm_site(ips, site_id, batch_size=None, engine=None, on_success=None, on_outcome=None):
+    """ Add an IPSet or iterable of IPs to a site, in concurrent chunks on `engine` if given; returns (or streams to `on_outcome`) one IPOutcome per collapsed target """
     # Endpoint for adding IPs to a site
-    endpoint = f"{base_url}/api/3/sites/{site_id}/included_targets"
-
-    # Create a session object
-    session = requests.Session()
-    session.verify = False  # Disable SSL verification
-    session.auth = HTTPBasicAuth(username, password)
+    endpoint = f"/api/3/sites/{site_id}/included_targets"
 
-    # Initialize response list
-    responses = []
+    # Shared InsightVM session (basic auth, SSL validation disabled)
+    client = get_client('insightvm')
 
-    # Add each IP to the site
-    for ip in ips:
+    def send_chunk(targets):
         try:
-            response = session.post(endpoint, json=[ip])
+            response = client.post(endpoint, json=targets)
             if response.status_code == 201:
-                responses.append({'ip': ip, 'status': 'success'})
-                logging.debug(f"Successfully added IP {ip} to site {site_id}.")
-            else:
-                error_message = response.json()
-                responses.append({'ip': ip, 'status': 'error', 'message': error_message})
-                logging.debug(f"Failed to add IP {ip} to site {site_id}: {error_message}")
+                logging.debug(f"Successfully added {len(targets)} targets to site {site_id}.")
+                return response.status_code, None
+            error_message = response.json()
+            logging.debug(f"Failed to add {len(targets)} targets to site {site_id}: {error_message}")
+            return response.status_code, {'message': bounded(error_message)}
         except requests.exceptions.RequestException as e:
-            responses.append({'ip': ip, 'status': 'error', 'message': str(e)})
-            logging.error(f"An error occurred while adding IP {ip} to site {site_id}: {e}")
+            logging.error(f"An error occurred while adding {len(targets)} targets to site {site_id}: {e}")
+            return None, {'message': str(e)}
 
-    # Return the response list as JSON
-    return json.dumps(responses, indent=2)
+    # Add the IPs as collapsed CIDRs/ranges, several targets per request
+    return send_in_batches(ips, send_chunk, batch_size, engine, f"insightvm:{site_id}", on_success, on_outcome)
 
 # Example function call
 if __name__ == "__main__":
+    configure_logging()
     example_ips = ["8.8.8.8", "4.4.4.4"]
     example_site_id = 201
     result = add_ips_to_insightvm_site(example_ips, example_site_id)
-    print(result)
\ No newline at end of file
+    print(json.dumps([outcome.to_dict() for outcome in result], indent=2))
\ No newline at end of file
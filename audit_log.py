@@ -0,0 +1,96 @@
+# filename: audit_log.py
+import os
+import json
+import logging
+import threading
+from datetime import datetime, timezone
+
+# JSON Lines file every per-target write outcome is appended to; empty keeps only the counters
+AUDIT_LOG_PATH = os.getenv('AUDIT_LOG_PATH', 'ip_sync_audit.jsonl')
+# Characters of an error message or response body kept per outcome
+AUDIT_MAX_ERROR_LENGTH = int(os.getenv('AUDIT_MAX_ERROR_LENGTH', '1024'))
+
+
+def bounded(value, limit=None):
+    """ An error message or body cut to `limit` characters; non-string values are serialized first if too long """
+    if value is None:
+        return None
+    limit = AUDIT_MAX_ERROR_LENGTH if limit is None else limit
+    text = value if isinstance(value, str) else json.dumps(value, default=str)
+    if len(text) <= limit:
+        return value
+    return f"{text[:limit]}... ({len(text) - limit} more characters)"
+
+
+class AuditSink:
+    """
+    Streams the write outcomes of one run to the audit file as they happen and keeps running
+    counters per target, action and status, so no outcome is held once it is recorded and the
+    run summary comes from the counters alone.
+    """
+
+    def __init__(self, path=None, run_id=None):
+        self.path = AUDIT_LOG_PATH if path is None else path
+        self.run_id = run_id
+        self._lock = threading.Lock()
+        self._file = None
+        self._counters = {}
+
+    def record(self, key, target_location, action, outcome):
+        """ Count one IPOutcome and append it to the audit file; thread-safe """
+        fields = outcome.to_dict()
+        for name in ('message', 'response_content'):
+            if name in fields:
+                fields[name] = bounded(fields[name])
+        line = json.dumps({
+            'time': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+            'run': self.run_id,
+            'target': key,
+            'location': target_location,
+            'action': action,
+            **fields,
+        }, default=str)
+        with self._lock:
+            counter = self._counters.setdefault((key, action, 'success' if outcome.ok else 'failure'), [0, 0])
+            counter[0] += 1
+            counter[1] += outcome.count
+            if self.path:
+                if self._file is None:
+                    self._file = open(self.path, 'a')
+                self._file.write(line + '\n')
+
+    def totals(self, key=None):
+        """ (successes, failures) in addresses, for one target or the whole run """
+        successes = failures = 0
+        with self._lock:
+            for (counter_key, _, status), (_, addresses) in self._counters.items():
+                if key is not None and counter_key != key:
+                    continue
+                if status == 'success':
+                    successes += addresses
+                else:
+                    failures += addresses
+        return successes, failures
+
+    def clean(self, key=None):
+        """ Whether no failed outcome was recorded, for one target or the whole run """
+        with self._lock:
+            return not any(
+                status == 'failure' and (key is None or counter_key == key)
+                for counter_key, _, status in self._counters
+            )
+
+    def summary(self):
+        """ One {'target', 'action', 'status', 'targets', 'addresses'} row per counter, sorted """
+        with self._lock:
+            return [
+                {'target': key, 'action': action, 'status': status, 'targets': targets, 'addresses': addresses}
+                for (key, action, status), (targets, addresses) in sorted(self._counters.items())
+            ]
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                logging.debug(f"Appended write outcomes to {self.path}.")
@@ -0,0 +1,252 @@
+# filename: benchmarks/mock_servers.py
+"""
+Local stand-ins for the InsightCloudSec, InsightVM and Shodan endpoints the sync uses, serving a
+synthetic estate. Each platform runs its own server with configurable latency, random 429
+injection and a requests-per-second quota, and counts every request it answers.
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import random
+import threading
+from dataclasses import dataclass
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ip_set import IPSet
+from insightvm_batches import format_target
+
+SITE_ID = '1'
+ALERT_ID = 'BENCHMARKALERT01'
+ALERT_NAME = 'benchmark'
+
+
+@dataclass(slots=True)
+class MockBehavior:
+    """ How a mock platform responds: added latency, share of random 429s, and a per-second quota """
+    latency: float = 0.0
+    throttle_rate: float = 0.0
+    quota: float = 0.0
+    retry_after: float = 1.0
+
+
+def synthetic_estate(size, seed=0):
+    """
+    Build a reproducible estate of about `size` IPv4 addresses: 60% in aligned CIDR blocks,
+    25% in unaligned ranges and 15% single hosts. Returns (inventory, site, alert) IPSets: the
+    estate, which the InsightCloudSec mock serves as one resource per address, and the current
+    InsightVM site and Shodan alert contents, which have drifted from it (about 5% of the estate
+    missing, plus stale entries).
+    """
+    rng = random.Random(seed)
+    intervals = []
+    budgets = [int(size * 0.6), int(size * 0.25)]
+    budgets.append(size - sum(budgets))
+
+    def base():
+        # Any 10.x.y.0 start keeps the estate in one private /8 without colliding with itself often
+        return (10 << 24) + rng.randrange(0, 1 << 24)
+
+    remaining = budgets[0]
+    while remaining > 0:
+        prefix = rng.randint(24, 28)
+        block = min(1 << (32 - prefix), remaining)
+        start = base() & ~((1 << (32 - prefix)) - 1)
+        intervals.append((4, start, start + block - 1))
+        remaining -= block
+    remaining = budgets[1]
+    while remaining > 0:
+        length = min(rng.randint(10, 300), remaining)
+        start = base()
+        intervals.append((4, start, start + length - 1))
+        remaining -= length
+    for _ in range(budgets[2]):
+        address = base()
+        intervals.append((4, address, address))
+
+    estate = IPSet.from_intervals(intervals)
+    merged = estate.intervals()
+    kept = [interval for interval in merged if rng.random() > 0.05]
+    stale = [(4, start, start + rng.randint(0, 15)) for start in (base() for _ in range(max(1, len(merged) // 20)))]
+    site = IPSet.from_intervals(kept + stale)
+    alert = IPSet.from_intervals([interval for interval in merged if rng.random() > 0.5] + stale)
+    return estate, site, alert
+
+
+class MockPlatform:
+    """ Shared state and request accounting for one mock platform server """
+
+    def __init__(self, name, behavior):
+        self.name = name
+        self.behavior = behavior
+        self.lock = threading.Lock()
+        self.requests = {}
+        self._window = 0
+        self._window_count = 0
+
+    def admit(self, route):
+        """ Count a request and decide whether it is throttled; returns a Retry-After or None """
+        with self.lock:
+            now = time.time()
+            if int(now) != self._window:
+                self._window, self._window_count = int(now), 0
+            self._window_count += 1
+            over_quota = self.behavior.quota and self._window_count > self.behavior.quota
+            throttled = over_quota or random.random() < self.behavior.throttle_rate
+            key = f"{route} {429 if throttled else 'ok'}"
+            self.requests[key] = self.requests.get(key, 0) + 1
+        if self.behavior.latency:
+            time.sleep(self.behavior.latency)
+        if not throttled:
+            return None
+        return (1 - now % 1) if over_quota else self.behavior.retry_after
+
+
+def _handler(platform, routes):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, payload, headers=None):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            # Compress large bodies when asked, as the real APIs do
+            if len(body) > 1024 and 'gzip' in self.headers.get('Accept-Encoding', ''):
+                body = gzip.compress(body, compresslevel=1)
+                self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _dispatch(self, method):
+            path = urlparse(self.path).path
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length)) if length else None
+            if path == '/_stats':
+                with platform.lock:
+                    return self._send(200, dict(platform.requests))
+            for route_method, matches, handle in routes:
+                if route_method == method and matches(path):
+                    route = f"{method} {matches.__doc__}"
+                    retry_after = platform.admit(route)
+                    if retry_after is not None:
+                        return self._send(429, {'message': 'Too Many Requests'}, {'Retry-After': f"{retry_after:.3f}"})
+                    return self._send(*handle(path, body))
+            self._send(404, {'message': f"No mock route for {method} {path}"})
+
+        def do_GET(self):
+            self._dispatch('GET')
+
+        def do_POST(self):
+            self._dispatch('POST')
+
+        def do_PUT(self):
+            self._dispatch('PUT')
+
+        def do_DELETE(self):
+            self._dispatch('DELETE')
+
+    return Handler
+
+
+def _route(doc, predicate):
+    predicate.__doc__ = doc
+    return predicate
+
+
+def insightcloudsec_routes(inventory):
+    addresses = list(inventory)
+    clouds = ['AWS', 'AZURE', 'GCE']
+
+    def query(path, body):
+        offset, limit = body.get('offset', 0), body.get('limit', 1000)
+        resources = [
+            {'publicip': {'common': {
+                'resource_name': address, 'cloud': clouds[index % 3], 'account': f"account-{index % 7}", 'region': 'us-east-1',
+            }}}
+            for index, address in enumerate(addresses[offset:offset + limit], offset)
+        ]
+        return 200, {'counts': {'publicip': len(addresses)}, 'resources': resources}
+
+    return [('POST', _route('/v3/public/resource/query', lambda path: path == '/v3/public/resource/query'), query)]
+
+
+def insightvm_routes(site):
+    sites = {SITE_ID: site}
+    lock = threading.Lock()
+    matches = _route('/api/3/sites/{id}/included_targets', lambda path: path.startswith('/api/3/sites/') and path.endswith('/included_targets'))
+
+    def site_id(path):
+        return path.split('/')[4]
+
+    def get(path, body):
+        with lock:
+            current = sites.get(site_id(path), IPSet())
+        return 200, {'addresses': [format_target(interval) for interval in current.intervals()]}
+
+    def post(path, body):
+        with lock:
+            sites[site_id(path)] = sites.get(site_id(path), IPSet()) | IPSet(body)
+        return 201, {}
+
+    def put(path, body):
+        with lock:
+            sites[site_id(path)] = IPSet(body)
+        return 200, {}
+
+    def delete(path, body):
+        with lock:
+            sites[site_id(path)] = sites.get(site_id(path), IPSet()) - IPSet(body)
+        return 200, {}
+
+    return [('GET', matches, get), ('POST', matches, post), ('PUT', matches, put), ('DELETE', matches, delete)]
+
+
+def shodan_routes(alert_ips):
+    alert = {'id': ALERT_ID, 'name': ALERT_NAME, 'filters': {'ip': [str(network) for network in alert_ips.cidrs()]}}
+
+    def info(path, body):
+        return 200, [alert]
+
+    def update(path, body):
+        if path.rsplit('/', 1)[-1] != ALERT_ID:
+            return 404, {'error': 'No such alert'}
+        alert['filters'] = body.get('filters', {})
+        return 200, alert
+
+    return [
+        ('GET', _route('/shodan/alert/info', lambda path: path == '/shodan/alert/info'), info),
+        ('POST', _route('/shodan/alert/{id}', lambda path: path.startswith('/shodan/alert/') and path != '/shodan/alert/info'), update),
+    ]
+
+
+def serve(size, seed, behaviors, ready, stop):
+    """
+    Run the three mock platforms for an estate of `size` addresses until `stop` is set. The
+    base URL of each platform is put on the `ready` queue once all of them are listening.
+    """
+    inventory, site, alert = synthetic_estate(size, seed)
+    servers = {}
+    for name, routes in (
+        ('insightcloudsec', insightcloudsec_routes(inventory)),
+        ('insightvm', insightvm_routes(site)),
+        ('shodan', shodan_routes(alert)),
+    ):
+        platform = MockPlatform(name, behaviors.get(name, MockBehavior()))
+        server = ThreadingHTTPServer(('127.0.0.1', 0), _handler(platform, routes))
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers[name] = server
+    ready.put({name: f"http://127.0.0.1:{server.server_address[1]}" for name, server in servers.items()})
+    stop.wait()
+    for server in servers.values():
+        server.shutdown()
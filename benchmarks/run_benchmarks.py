@@ -0,0 +1,150 @@
+# filename: benchmarks/run_benchmarks.py
+"""
+Offline benchmark of calculate_changes and implement_changes against the local mock platforms.
+
+For every estate size, fresh mock servers are started in a child process (so their memory is not
+counted) and one InsightCloudSec inventory is synced to an InsightVM site and a Shodan alert.
+Wall time, requests per endpoint (and how many were throttled) and the peak Python memory of
+each phase are reported.
+
+    python benchmarks/run_benchmarks.py --sizes 1000,10000,100000 --latency 0.005 --throttle-rate 0.02
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+import multiprocessing
+
+# The proactive client limits and snapshot reuse would otherwise dominate the measurement
+for name, value in {
+    'INSIGHTCLOUDSEC_REQUESTS_PER_SECOND': '0',
+    'INSIGHTVM_REQUESTS_PER_SECOND': '0',
+    'SHODAN_REQUESTS_PER_SECOND': '0',
+    'ADAPTIVE_MAX_RATE': '100000',
+    'SNAPSHOT_TTL': '0',
+    'HTTP_BACKOFF_CAP': '2',
+    'LOGGING_LEVEL': 'WARNING',
+    # Outcomes are still serialized, but not kept on disk
+    'AUDIT_LOG_PATH': os.devnull,
+}.items():
+    os.environ.setdefault(name, value)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from mock_servers import ALERT_NAME, SITE_ID, MockBehavior, serve
+from calculate_changes import calculate_changes
+from change_plan import ApplyCheckpoint
+from http_client import close_clients
+from log_config import configure_logging
+from main import implement_changes
+from shodan_alerts import get_alert_catalogue
+from snapshot_store import SnapshotStore
+from sync_plan import validate_sync_plan
+
+DEFAULT_SIZES = '1000,10000,100000'
+
+
+def benchmark_plan():
+    return validate_sync_plan({
+        'sources': {'inventory': {'type': 'insightcloudsec'}},
+        'pairs': [
+            {'source': 'inventory', 'target': {'type': 'insightvm', 'site_id': SITE_ID}},
+            {'source': 'inventory', 'target': {'type': 'shodan', 'alert': ALERT_NAME}},
+        ],
+    })
+
+
+def request_counts(urls):
+    """ {platform: {'<METHOD> <route> <ok|429>': count}} as reported by the mock servers """
+    return {platform: requests.get(f"{url}/_stats", timeout=10).json() for platform, url in urls.items()}
+
+
+def count_delta(before, after):
+    delta = {}
+    for platform, counts in after.items():
+        for route, count in counts.items():
+            change = count - before.get(platform, {}).get(route, 0)
+            if change:
+                delta[f"{platform} {route}"] = change
+    return delta
+
+
+def measure(phase, urls, func):
+    before = request_counts(urls)
+    tracemalloc.reset_peak()
+    started = time.perf_counter()
+    result = func()
+    wall = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    requests_made = count_delta(before, request_counts(urls))
+    return result, {
+        'phase': phase,
+        'wall_seconds': round(wall, 3),
+        'requests': sum(requests_made.values()),
+        'throttled': sum(count for route, count in requests_made.items() if route.endswith(' 429')),
+        'peak_mib': round(peak / 2 ** 20, 1),
+        'by_endpoint': requests_made,
+    }
+
+
+def run_size(size, args, behaviors):
+    ready, stop = multiprocessing.Queue(), multiprocessing.Event()
+    server = multiprocessing.Process(target=serve, args=(size, args.seed, behaviors, ready, stop), daemon=True)
+    server.start()
+    try:
+        urls = ready.get(timeout=600)
+        os.environ['INSIGHTCLOUDSEC_BASE_URL'] = urls['insightcloudsec']
+        os.environ['INSIGHTVM_BASE_URL'] = urls['insightvm']
+        os.environ['SHODAN_BASE_URL'] = urls['shodan']
+        # New servers per size: drop pooled connections and the cached alert catalogue
+        close_clients()
+        get_alert_catalogue().invalidate()
+
+        with tempfile.TemporaryDirectory() as state_dir:
+            store = SnapshotStore(os.path.join(state_dir, 'state.db'))
+            plan = benchmark_plan()
+            changes, calculate = measure('calculate_changes', urls, lambda: calculate_changes(plan, store))
+            checkpoint = ApplyCheckpoint(store, {change.key: 'benchmark' for change in changes})
+            _, implement = measure('implement_changes', urls, lambda: implement_changes(plan, changes, store, checkpoint))
+            store.close()
+        return [dict(row, size=size) for row in (calculate, implement)]
+    finally:
+        stop.set()
+        server.join(timeout=10)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the sync against local mock platforms.")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help=f"comma-separated estate sizes in addresses (default {DEFAULT_SIZES}; up to 1000000)")
+    parser.add_argument('--seed', type=int, default=0, help="seed for the synthetic estates")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every mock response")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="share of mock requests answered with 429")
+    parser.add_argument('--quota', type=float, default=0.0, help="requests per second each mock platform accepts before answering 429 (0 = unlimited)")
+    parser.add_argument('--retry-after', type=float, default=1.0, help="Retry-After seconds sent with injected 429s")
+    parser.add_argument('--json', dest='json_path', help="also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    configure_logging()
+    behavior = MockBehavior(args.latency, args.throttle_rate, args.quota, args.retry_after)
+    behaviors = {platform: behavior for platform in ('insightcloudsec', 'insightvm', 'shodan')}
+
+    tracemalloc.start()
+    results = []
+    print(f"{'size':>9}  {'phase':<18} {'wall s':>8} {'requests':>9} {'429s':>6} {'peak MiB':>9}")
+    for size in (int(value) for value in args.sizes.split(',')):
+        for row in run_size(size, args, behaviors):
+            results.append(row)
+            print(f"{row['size']:>9}  {row['phase']:<18} {row['wall_seconds']:>8.3f} {row['requests']:>9} {row['throttled']:>6} {row['peak_mib']:>9.1f}")
+    tracemalloc.stop()
+
+    if args.json_path:
+        with open(args.json_path, 'w') as results_file:
+            json.dump(results, results_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,67 +1,175 @@
 import json
 import logging
-from get_insightcloudsec_ips import get_insightcloudsec_ips
+from get_insightcloudsec_ips import iter_insightcloudsec_ips
 from get_insightvm_site_contents import get_insightvm_site_contents
 from get_shodan_net_contents import get_shodan_net_contents
-
-# Set up structured logging with a specific format for later log collection
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+from get_cloudflare_ips import get_cloudflare_ips
+from ip_set import IPSet
+from metadata_index import MetadataIndex
+from fetch_stage import run_fetch_stage
+from snapshot_store import SnapshotStore
+from sync_plan import group_targets, load_sync_plan
+from results import TargetChange
+from log_config import configure_logging, summarize_ips
+from metrics import metrics
 
 # Custom logger for structured JSON logging
 class StructuredLogger(logging.LoggerAdapter):
+    """
+    Logs each record as one JSON object. `extra` may be a callable returning the payload, so
+    expensive payloads are only built when the level is enabled.
+    """
     def log(self, level, msg, *args, **kwargs):
         if self.isEnabledFor(level):
+            if callable(kwargs.get('extra')):
+                kwargs['extra'] = kwargs['extra']()
+            kwargs['level'] = logging.getLevelName(level)
             msg, kwargs = self.process(msg, kwargs)
             self.logger.log(level, msg, *args, **kwargs)
 
     def process(self, msg, kwargs):
-        # Include the log level name (e.g., "DEBUG", "INFO") in the JSON output
-        level_name = logging.getLevelName(self.logger.getEffectiveLevel())
-        return json.dumps({'level': level_name, 'message': msg, **kwargs}), {}
+        # Include the record's level name (e.g., "DEBUG", "INFO") in the JSON output
+        level_name = kwargs.pop('level', None) or logging.getLevelName(self.logger.getEffectiveLevel())
+        return json.dumps({'level': level_name, 'message': msg, **kwargs}, default=str), {}
 
 logger = StructuredLogger(logging.getLogger(__name__), {})
 
-def calculate_changes(insightvm_azure_aws_site_id, shodan_azure_aws_net):
+def fetch_insightcloudsec_ips():
+    # Index the inventory while later pages are still being fetched, so pairs can route on its metadata
+    return MetadataIndex(iter_insightcloudsec_ips())
+
+# Fetchers by source/target type, each taking the plan entry; all return IPSets (or a
+# MetadataIndex for InsightCloudSec) and raise PlatformError on failure
+SOURCE_FETCHERS = {
+    'insightcloudsec': lambda source: fetch_insightcloudsec_ips(),
+    'cloudflare': lambda source: get_cloudflare_ips(),
+}
+TARGET_FETCHERS = {
+    'insightvm': lambda target: get_insightvm_site_contents(target['site_id']),
+    'shodan': lambda target: get_shodan_net_contents(target['alert']),
+}
+
+def _log_delta(key, previous, current):
+    if previous is None:
+        logger.debug(f"No previous snapshot for {key}.")
+    elif previous.digest == current.digest():
+        logger.debug(f"{key} unchanged since last snapshot.")
+    else:
+        logger.debug(f"{key} changed since last snapshot.", extra=lambda: {
+            'added': (current - previous.ip_set).num_addresses,
+            'removed': (previous.ip_set - current).num_addresses,
+        })
+
+def _source_fetches(plan, targets):
+    fetches = {}
+    for entry in targets.values():
+        for selection in entry['sources']:
+            source = plan['sources'][selection['source']]
+            fetches[selection['source']] = lambda source=source: SOURCE_FETCHERS[source['type']](source)
+    return fetches
+
+def _record_fetches(fetched, store):
+    for name, value in fetched.items():
+        ip_set = value.ip_set if isinstance(value, MetadataIndex) else value
+        _log_delta(name, store.record_fetch(name, ip_set), ip_set)
+
+def fetch_sources(plan, store=None):
+    """ Fetch every source the plan's pairs use, concurrently; returns {source name: IPSet or MetadataIndex} """
+    store = store or SnapshotStore()
+    fetched = run_fetch_stage(_source_fetches(plan, group_targets(plan)), max_workers=plan['max_workers'])
+    _record_fetches(fetched, store)
+    return fetched
+
+def select_sources(plan, sources):
+    """ The source set of every target: the union of its pairs' (routed) selections. Returns {target key: IPSet} """
+    selected = {}
+    for key, entry in group_targets(plan).items():
+        # One inventory pull is split into per-target source sets by each pair's routing rule
+        source_ips = IPSet()
+        for selection in entry['sources']:
+            value = sources[selection['source']]
+            if isinstance(value, MetadataIndex):
+                source_ips = source_ips | value.select(selection['where'])
+            else:
+                source_ips = source_ips | value
+        selected[key] = source_ips
+    return selected
+
+def calculate_changes(plan=None, store=None, sources=None):
+    """
+    Compute the additions and removals for every target of a sync plan.
+
+    Each distinct source and target is fetched once, all of them concurrently (bounded by the
+    plan's max_workers), and shared sources are fanned out to every target they feed. Sources
+    already fetched with fetch_sources() can be passed in and are not fetched again. Returns
+    one TargetChange per target.
+    """
     logger.debug("Starting to calculate changes between sources and targets.")
+    plan = plan or load_sync_plan()
+    store = store or SnapshotStore()
+    targets = group_targets(plan)
 
-    logger.debug("Fetching IPs from InsightCloudSec API.")
-    insightcloudsec_ips_data = get_insightcloudsec_ips()
-    insightcloudsec_ips = {ip['IP Address'] for ip in json.loads(insightcloudsec_ips_data)}
-    logger.debug('InsightCloudSec API response received', extra={'response': insightcloudsec_ips_data})
+    fetches = _source_fetches(plan, targets) if sources is None else {}
 
-    logger.debug("Fetching IPs from InsightVM for Azure/AWS site.")
-    insightvm_insightcloudsec_ips_data = get_insightvm_site_contents(insightvm_azure_aws_site_id)
-    insightvm_insightcloudsec_ips = set(json.loads(insightvm_insightcloudsec_ips_data))
-    logger.debug('InsightVM Azure/AWS site contents received', extra={'response': insightvm_insightcloudsec_ips_data})
+    # Targets this tool wrote within the snapshot TTL are taken from the store instead of refetched
+    inputs = dict(sources or {})
+    for key, entry in targets.items():
+        trusted = store.trusted_target(key)
+        if trusted is not None:
+            inputs[key] = trusted
+        else:
+            fetches[key] = lambda target=entry['target']: TARGET_FETCHERS[target['type']](target)
 
-    logger.debug("Fetching IPs from Shodan for Azure/AWS network.")
-    shodan_insightcloudsec_ips_data = get_shodan_net_contents(shodan_azure_aws_net)
-    shodan_insightcloudsec_ips = set(json.loads(shodan_insightcloudsec_ips_data)['ip'])
-    logger.debug('Shodan Azure/AWS network contents received', extra={'response': shodan_insightcloudsec_ips_data})
+    # Fetch every remaining source and target concurrently; any failure or timeout aborts the diff
+    logger.debug(f"Fetching IPs from {', '.join(fetches)}.")
+    fetched = run_fetch_stage(fetches, max_workers=plan['max_workers'])
+    _record_fetches(fetched, store)
+    inputs.update(fetched)
 
-    # Calculate additions and removals
-    insightvm_insightcloudsec_additions = insightcloudsec_ips - insightvm_insightcloudsec_ips
-    insightvm_insightcloudsec_removals = insightvm_insightcloudsec_ips - insightcloudsec_ips
+    changes = []
+    for key, source_ips in select_sources(plan, inputs).items():
+        target_ips = inputs[key]
 
-    # Log results
-    logger.debug("Calculated changes successfully.", extra={'changes': {
-        "insightvm_insightcloudsec_additions": list(insightvm_insightcloudsec_additions) if insightvm_insightcloudsec_additions else None,
-        "insightvm_insightcloudsec_removals": list(insightvm_insightcloudsec_removals) if insightvm_insightcloudsec_removals else None,
-    }})
+        # Calculate additions and removals on merged intervals; writers expand to single hosts lazily
+        with metrics.timer('phase', phase='diff', name=key):
+            additions = source_ips - target_ips
+            removals = target_ips - source_ips
+        for kind, ip_set in (('source', source_ips), ('target', target_ips), ('additions', additions), ('removals', removals)):
+            metrics.set_gauge('set_addresses', ip_set.num_addresses, target=key, set=kind)
+            metrics.set_gauge('set_ranges', ip_set.num_ranges, target=key, set=kind)
+        logger.debug(f"Calculated changes for {key}.", extra=lambda: {'changes': {
+            'additions': summarize_ips(additions),
+            'removals': summarize_ips(removals),
+        }})
+        if not additions and not removals:
+            logger.debug(f"Nothing moved for {key}; no changes to apply.")
 
-    return {
-        "insightvm_insightcloudsec_additions": list(insightvm_insightcloudsec_additions) if insightvm_insightcloudsec_additions else None,
-        "insightvm_insightcloudsec_removals": list(insightvm_insightcloudsec_removals) if insightvm_insightcloudsec_removals else None,
-    }
+        changes.append(TargetChange(
+            key, targets[key]['target'], source_ips, target_ips,
+            additions=additions if additions else None,
+            removals=removals if removals else None,
+        ))
 
-if __name__ == '__main__':
-    # Example identifiers for network names and site IDs
-    SHODAN_AZURE_AWS_NET = "Cloud Public IPs (Azure&AWS)"
-    INSIGHTVM_AZURE_AWS_SITE_ID = "200"
+    return changes
+
+def record_applied_changes(change, store=None):
+    """ Record the target contents implied by a fully successful apply of one target's change """
+    store = store or SnapshotStore()
+    target_ips = change.target_ips
+    if change.removals:
+        target_ips = target_ips - change.removals
+    if change.additions:
+        target_ips = target_ips | change.additions
+    store.record_write(change.key, target_ips)
 
-    # Call the function with the specified identifiers
+if __name__ == '__main__':
+    # Calculate the changes for the configured sync plan without applying them
+    configure_logging('DEBUG')
     try:
-        changes = calculate_changes(INSIGHTVM_AZURE_AWS_SITE_ID, SHODAN_AZURE_AWS_NET)
-        logger.debug('Calculated changes successfully', extra={'changes': changes})
+        for change in calculate_changes():
+            logger.debug('Calculated changes successfully', extra=lambda: {'target': change.key, 'changes': {
+                'additions': summarize_ips(change.additions),
+                'removals': summarize_ips(change.removals),
+            }})
     except Exception as e:
         logger.error('Failed to calculate changes', extra={'error': str(e)})
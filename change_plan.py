@@ -0,0 +1,175 @@
+# filename: change_plan.py
+import os
+import json
+import time
+import hashlib
+import logging
+from calculate_changes import calculate_changes, fetch_sources, select_sources
+from change_planner import plan_insightvm_change
+from ip_set import IPSet
+from results import TargetChange
+from sync_plan import select_targets, target_intervals, target_key
+from metrics import metrics
+
+# Where the computed diff is written before it is applied, and how long beyond a target's sync
+# interval its unfinished part may still be resumed
+CHANGE_PLAN_PATH = os.getenv('CHANGE_PLAN_PATH', 'change_plan.json')
+CHANGE_PLAN_MAX_AGE = float(os.getenv('CHANGE_PLAN_MAX_AGE', '3600'))
+
+
+def target_digest(sync_plan, key, source_ips):
+    """ Digest of what one target's diff depends on: the pairs feeding it and its source set """
+    payload = json.dumps({
+        'pairs': [pair for pair in sync_plan['pairs'] if target_key(pair['target']) == key],
+        'source': source_ips.digest(),
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def build_plan_entry(sync_plan, change):
+    """ The reviewable, resumable form of one target's computed diff """
+    entry = {
+        'digest': target_digest(sync_plan, change.key, change.source_ips),
+        'created_at': time.time(),
+        'target': change.target,
+        'source': change.source_ips.to_strings(),
+        'current': change.target_ips.to_strings(),
+        'additions': change.additions.to_strings() if change.additions else [],
+        'removals': change.removals.to_strings() if change.removals else [],
+    }
+    if change.target['type'] == 'insightvm' and not change.is_empty:
+        # Decided once here, so a resumed apply keeps the strategy its checkpoints were written under
+        change.strategy = change.strategy or plan_insightvm_change(change)['strategy']
+        entry['strategy'] = change.strategy
+    return entry
+
+
+def change_from_entry(key, entry):
+    """ Rebuild the TargetChange recorded in a change plan entry """
+    source_ips, target_ips = IPSet(entry['source']), IPSet(entry['current'])
+    additions, removals = source_ips - target_ips, target_ips - source_ips
+    return TargetChange(
+        key, entry['target'], source_ips, target_ips,
+        additions=additions if additions else None,
+        removals=removals if removals else None,
+        strategy=entry.get('strategy'),
+    )
+
+
+def write_change_plan(change_plan, path=None):
+    path = path or CHANGE_PLAN_PATH
+    if not change_plan['targets']:
+        discard_change_plan(path)
+        return
+    # Write to a temporary file first, so a crash never leaves a truncated plan behind
+    with open(f"{path}.tmp", 'w') as plan_file:
+        json.dump(change_plan, plan_file, indent=2)
+    os.replace(f"{path}.tmp", path)
+    logging.info(f"Wrote change plan for {len(change_plan['targets'])} targets to {path}.")
+
+
+def load_change_plan(path=None):
+    """ The change plan file as {'targets': {target key: entry}}; empty when missing or unreadable """
+    path = path or CHANGE_PLAN_PATH
+    if not os.path.exists(path):
+        return {'targets': {}}
+    try:
+        with open(path) as plan_file:
+            change_plan = json.load(plan_file)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable change plan {path}: {e}")
+        return {'targets': {}}
+    if not isinstance(change_plan.get('targets'), dict):
+        logging.warning(f"Ignoring change plan {path} in an older format.")
+        return {'targets': {}}
+    return change_plan
+
+
+def discard_change_plan(path=None):
+    path = path or CHANGE_PLAN_PATH
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def prepare_changes(sync_plan, store, path=None):
+    """
+    Return (change_plan, changes) for the targets of `sync_plan`.
+
+    The change plan file holds one entry per target, each with the digest of its own inputs, so
+    daemon cycles covering different targets never replace each other's unfinished entries. An
+    entry younger than its target's sync interval plus CHANGE_PLAN_MAX_AGE is resumed when its
+    digest still matches; only the sources are refetched to check that, not the targets, which
+    the interrupted apply has partly written, and only when some entry could be resumed. The
+    other targets are diffed afresh, and only their old entries and checkpoints are replaced.
+    """
+    change_plan = load_change_plan(path)
+    entries = change_plan['targets']
+    intervals = target_intervals(sync_plan)
+    now = time.time()
+    resumable = {
+        key: entries[key] for key in intervals
+        if key in entries and now - entries[key].get('created_at', 0) <= intervals[key] + CHANGE_PLAN_MAX_AGE
+    }
+
+    sources = None
+    resumed = {}
+    if resumable:
+        sources = fetch_sources(sync_plan, store)
+        selected = select_sources(sync_plan, sources)
+        for key, entry in resumable.items():
+            if target_digest(sync_plan, key, selected[key]) == entry.get('digest'):
+                logging.info(f"Resuming the change plan of {key}; its inputs are unchanged.")
+                resumed[key] = change_from_entry(key, entry)
+            else:
+                logging.info(f"Inputs of {key} changed since its change plan; computing a new one.")
+
+    fresh_keys = [key for key in intervals if key not in resumed]
+    changes = dict(resumed)
+    if fresh_keys:
+        fresh_plan = select_targets(sync_plan, fresh_keys)
+        fresh = calculate_changes(fresh_plan, store, sources)
+        # Checkpoints of the entries being replaced no longer describe what is left to do
+        replaced = [entries[key]['digest'] for key in fresh_keys if 'digest' in entries.get(key, {})]
+        with metrics.timer('phase', phase='plan', name='change_plan'):
+            for change in fresh:
+                entries[change.key] = build_plan_entry(fresh_plan, change)
+                changes[change.key] = change
+            write_change_plan(change_plan, path)
+        store.clear_progress(replaced)
+    return change_plan, [changes[key] for key in intervals]
+
+
+def complete_targets(change_plan, keys, store, path=None):
+    """ Remove the entries and checkpoints of cleanly applied targets from the change plan """
+    # Reread the file in case it changed since this cycle loaded it
+    current = load_change_plan(path)
+    digests = [change_plan['targets'][key]['digest'] for key in keys if key in change_plan['targets']]
+    for key in keys:
+        if current['targets'].get(key, {}).get('digest') == change_plan['targets'].get(key, {}).get('digest'):
+            current['targets'].pop(key, None)
+    write_change_plan(current, path)
+    store.clear_progress(digests)
+
+
+class ApplyCheckpoint:
+    """ Per-batch progress of a change plan's targets, backed by the state database """
+
+    def __init__(self, store, digests):
+        self.store = store
+        # {target key: digest of the change plan entry being applied}
+        self.digests = digests
+        self._progress = {}
+        for digest in set(digests.values()):
+            self._progress.update(store.get_progress(digest))
+
+    def done(self, key, action):
+        """ The addresses already written for one target and action when the plan was loaded """
+        return self._progress.get((key, action), IPSet())
+
+    def acknowledged(self, key, action):
+        """ Whether any write of one target and action was acknowledged, even one of an empty set """
+        return (key, action) in self._progress
+
+    def recorder(self, key, action):
+        """ A callback that checkpoints each acknowledged batch of one target and action """
+        return lambda ip_set: self.store.record_progress(self.digests[key], key, action, ip_set)
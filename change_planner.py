@@ -0,0 +1,53 @@
+# filename: change_planner.py
+import math
+import logging
+from insightvm_batches import INSIGHTVM_BATCH_SIZE
+from replace_ips_in_insightvm_site import INSIGHTVM_REPLACE_MAX_TARGETS
+
+INCREMENTAL = 'incremental'
+REPLACE = 'replace'
+
+
+def estimate_requests(num_targets, batch_size):
+    return math.ceil(num_targets / batch_size) if num_targets else 0
+
+
+def plan_insightvm_change(change, batch_size=None, replace_limit=None):
+    """
+    Choose between applying an InsightVM change as batched additions/removals or as one full
+    replacement of the site's included targets, whichever needs fewer requests.
+
+    Both sides are estimated in batch-sized requests, so payload counts as well as round trips.
+    Incremental costs one request per batch of collapsed additions plus one per batch of removals.
+    A replace re-reads the site (to keep its hostname targets) and PUTs the whole collapsed source
+    set, which weighs as many batches as it carries targets (at least one), plus batched POSTs for
+    whatever exceeds the PUT limit. A small diff
+    on a large site therefore stays incremental instead of rewriting every untouched target.
+    Ties keep the incremental strategy. Returns a dict with the chosen strategy and both estimates.
+    """
+    batch_size = batch_size or INSIGHTVM_BATCH_SIZE
+    replace_limit = replace_limit or INSIGHTVM_REPLACE_MAX_TARGETS
+    additions = change.additions.num_ranges if change.additions else 0
+    removals = change.removals.num_ranges if change.removals else 0
+    source_targets = change.source_ips.num_ranges
+
+    incremental_requests = estimate_requests(additions, batch_size) + estimate_requests(removals, batch_size)
+    replace_requests = (
+        1 + max(1, estimate_requests(min(source_targets, replace_limit), batch_size))
+        + estimate_requests(max(0, source_targets - replace_limit), batch_size)
+    )
+    strategy = REPLACE if replace_requests < incremental_requests else INCREMENTAL
+
+    decision = {
+        'strategy': strategy,
+        'incremental_requests': incremental_requests,
+        'replace_requests': replace_requests,
+        # Requests saved over the strategy not chosen
+        'savings': incremental_requests - replace_requests if strategy == REPLACE else replace_requests - incremental_requests,
+    }
+    logging.info(
+        f"{change.key}: {strategy} apply chosen ({additions} addition and {removals} removal ranges, "
+        f"{change.target_ips.num_ranges} current ranges); estimated {incremental_requests} incremental vs "
+        f"{replace_requests} replace requests, saving {decision['savings']}."
+    )
+    return decision
@@ -0,0 +1,101 @@
+# filename: daemon.py
+import os
+import time
+import random
+import signal
+import logging
+import threading
+from fetch_stage import FetchError
+from http_client import close_clients
+from log_config import configure_logging
+from main import INSIGHTVM_AZURE_AWS_SITE_ID, run_cycle
+from rate_limit import load_learned_rates
+from snapshot_store import SnapshotStore
+from sync_plan import SyncPlanError, load_sync_plan, select_targets, target_intervals
+from write_engine import get_write_engine
+
+# Fraction of each interval by which a target's next cycle is randomly moved earlier or later
+SYNC_JITTER = float(os.getenv('SYNC_JITTER', '0.1'))
+
+
+class SyncScheduler:
+    """
+    Tracks when each target is next due. Every target is due at start-up; after a cycle its next
+    run is its interval (with jitter) after the cycle finished, so an overrun never causes a burst
+    of catch-up cycles.
+    """
+
+    def __init__(self, intervals, jitter=None):
+        self.intervals = intervals
+        self.jitter = SYNC_JITTER if jitter is None else jitter
+        now = time.monotonic()
+        self._next_due = {key: now for key in intervals}
+
+    def due(self, now=None):
+        now = time.monotonic() if now is None else now
+        return [key for key, due_at in self._next_due.items() if due_at <= now]
+
+    def reschedule(self, keys, now=None):
+        now = time.monotonic() if now is None else now
+        for key in keys:
+            interval = self.intervals[key]
+            self._next_due[key] = now + interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def seconds_until_next(self, now=None):
+        now = time.monotonic() if now is None else now
+        return max(0.0, min(self._next_due.values()) - now)
+
+
+def run_daemon(plan=None):
+    """
+    Run sync cycles on each target's schedule until SIGTERM or SIGINT.
+
+    Connection pools, the Shodan alert catalogue, the write engine and the state database stay
+    open between cycles. Cycles run one at a time on this thread. A stop signal is only checked
+    between cycles, so a cycle in progress finishes its write batches and records its snapshots
+    before the daemon exits.
+    """
+    stop = threading.Event()
+
+    def request_stop(signum, frame):
+        logging.info(f"Received {signal.Signals(signum).name}; stopping after the current cycle.")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    plan = plan or load_sync_plan(default_site_id=INSIGHTVM_AZURE_AWS_SITE_ID)
+    store = SnapshotStore()
+    load_learned_rates(store.get_rates())
+    scheduler = SyncScheduler(target_intervals(plan))
+    logging.info(f"Sync daemon started for {len(scheduler.intervals)} target(s).")
+
+    try:
+        while not stop.is_set():
+            due = scheduler.due()
+            if not due:
+                stop.wait(scheduler.seconds_until_next())
+                continue
+            logging.info(f"Starting sync cycle for {', '.join(due)}.")
+            try:
+                run_cycle(select_targets(plan, due), store)
+            except FetchError as e:
+                # Nothing was written; the targets are retried on their next scheduled cycle
+                logging.error(f"Synchronization aborted: {e}")
+            except Exception:
+                logging.exception("Sync cycle failed unexpectedly.")
+            scheduler.reschedule(due)
+    finally:
+        get_write_engine().shutdown(wait=True)
+        close_clients()
+        store.close()
+        logging.info("Sync daemon stopped.")
+
+
+if __name__ == "__main__":
+    configure_logging()
+    try:
+        run_daemon()
+    except SyncPlanError as e:
+        logging.error(f"Sync daemon not started: {e}")
+        raise SystemExit(1)
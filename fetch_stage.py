@@ -0,0 +1,83 @@
+# filename: fetch_stage.py
+import os
+import time
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from results import SyncError
+from metrics import metrics
+
+# Seconds each source/target read may take before the stage gives up on it
+FETCH_TIMEOUT = float(os.getenv('FETCH_TIMEOUT', '600'))
+
+
+class FetchError(SyncError):
+    """ Raised when one or more inputs of a diff could not be fetched """
+
+    def __init__(self, errors):
+        self.errors = errors
+        details = '; '.join(f"{name}: {error}" for name, error in errors.items())
+        super().__init__(f"Failed to fetch {len(errors)} input(s): {details}")
+
+
+def _next_deadline(pending, futures, started, timeout):
+    """ Seconds until the earliest started pending fetch times out, or a full timeout while none has started """
+    deadlines = [started[futures[future]] + timeout for future in pending if futures[future] in started]
+    return max(0.0, min(deadlines) - time.monotonic()) if deadlines else timeout
+
+
+def run_fetch_stage(fetches, timeout=None, max_workers=None):
+    """
+    Run every fetch callable in `fetches` ({name: callable}) concurrently.
+
+    At most `max_workers` fetches run at once (default: all of them).
+    Returns {name: result} when all of them succeed. Exceptions and fetches still running
+    `timeout` seconds after they started are collected and raised together as a FetchError, so a
+    diff is never computed against a missing input. Time a fetch spends queued behind others
+    does not count against its timeout.
+    """
+    timeout = FETCH_TIMEOUT if timeout is None else timeout
+    results = {}
+    errors = {}
+    durations = {}
+    started = {}
+
+    def timed(name, fetch):
+        started[name] = time.monotonic()
+        try:
+            return fetch()
+        finally:
+            durations[name] = time.monotonic() - started[name]
+            metrics.observe('phase', durations[name], phase='fetch', name=name)
+
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers or len(fetches)), thread_name_prefix='fetch')
+    try:
+        futures = {executor.submit(timed, name, fetch): name for name, fetch in fetches.items()}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=_next_deadline(pending, futures, started, timeout), return_when=FIRST_COMPLETED)
+            for future in done:
+                name = futures[future]
+                try:
+                    results[name] = future.result()
+                    logging.debug(f"Fetched {name} in {durations[name]:.2f}s.")
+                except Exception as e:
+                    errors[name] = e
+            now = time.monotonic()
+            expired = {future for future in pending if futures[future] in started and now - started[futures[future]] >= timeout}
+            for future in expired:
+                errors[futures[future]] = TimeoutError(f"timed out after {timeout:g}s")
+            if expired:
+                # The diff cannot be computed now, and queued fetches may never get a free worker
+                pending = set()
+    finally:
+        # Do not block on a stalled platform; its thread finishes in the background
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    if errors:
+        skipped = [name for name in fetches if name not in results and name not in errors]
+        if skipped:
+            logging.debug(f"Abandoned the fetches of {', '.join(skipped)} after a timeout.")
+        for name, error in errors.items():
+            logging.error(f"Fetch of {name} failed: {error}")
+        raise FetchError(errors)
+    return results
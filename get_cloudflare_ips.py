@@ -0,0 +1,29 @@
+# filename: get_cloudflare_ips.py
+import requests
+import json
+import logging
+from ip_set import IPSet
+from http_client import get_client, platform_error
+from log_config import configure_logging
+
+def get_cloudflare_ips():
+    """ Cloudflare's published IPv4 and IPv6 ranges as an IPSet; raises PlatformError """
+    # Cloudflare publishes its edge ranges on a public, unauthenticated endpoint
+    client = get_client('cloudflare')
+
+    try:
+        response = client.get("/client/v4/ips")
+        response.raise_for_status()
+        result = response.json().get('result', {})
+        ip_set = IPSet(result.get('ipv4_cidrs', []) + result.get('ipv6_cidrs', []))
+        logging.debug(f"Retrieved {ip_set.num_ranges} Cloudflare ranges.")
+        return ip_set
+
+    except requests.exceptions.RequestException as e:
+        logging.error(f"An error occurred: {e}")
+        raise platform_error('cloudflare', e) from e
+
+# Example function call
+if __name__ == "__main__":
+    configure_logging()
+    print(json.dumps(get_cloudflare_ips().to_strings(), indent=4))
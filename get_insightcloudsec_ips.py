@@ -2,72 +2,141 @@ import os
 import requests
 import json
 import logging
-import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http_client import get_client, platform_error
+from json_stream import iter_response_items
+from metadata_index import INDEXED_FIELDS
+from results import PlatformError
+from log_config import configure_logging
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
+# Pagination settings
+INSIGHTCLOUDSEC_PAGE_SIZE = int(os.getenv('INSIGHTCLOUDSEC_PAGE_SIZE', '1000'))
+INSIGHTCLOUDSEC_MAX_WORKERS = int(os.getenv('INSIGHTCLOUDSEC_MAX_WORKERS', '4'))
 
-# Retrieve environment variables
-INSIGHTCLOUDSEC_BASE_URL = os.getenv('INSIGHTCLOUDSEC_BASE_URL')
-INSIGHTCLOUDSEC_API_KEY = os.getenv('INSIGHTCLOUDSEC_API_KEY')
+# Metadata kept per resource: the identity plus the keys and tags the metadata index routes on
+METADATA_KEYS = ('resource_name', 'tags') + tuple(key for keys in INDEXED_FIELDS.values() for key in keys)
 
-def get_insightcloudsec_ips():
-    url = f"{INSIGHTCLOUDSEC_BASE_URL}/v3/public/resource/query"
-    headers = {
-        'Content-Type': 'application/json',
-        'Accept': 'application/json',
-        'Api-Key': INSIGHTCLOUDSEC_API_KEY
-    }
+def _fetch_page(client, offset, limit):
+    """
+    Fetch one page and return (entries, received, fields): its projected entries, the number of
+    resources it held and the response's other top-level members. The body is parsed while it
+    streams in, so only the projected entries are ever held, never the raw page.
+    """
     payload = {
         "selected_resource_type": "publicip",
-        "limit": 1000,
-        "offset": 0
+        "limit": limit,
+        "offset": offset
     }
-
+    fields = {}
+    entries = []
+    received = 0
+    # Rate limiting is retried by the shared client
     try:
-        response = requests.post(url, headers=headers, json=payload)
-        if response.status_code == 429:
-            logging.warning("Rate limit reached, retrying after some time...")
-            time.sleep(60)  # Simple backoff strategy, wait for 60 seconds
-            return get_insightcloudsec_ips()  # Retry the request
-
-        response.raise_for_status()  # Raises an HTTPError if the HTTP request returned an unsuccessful status code
-        logging.debug("API call successful, processing data...")
-
-        data = response.json()
-        resources = data.get('resources', [])
-
-        # Filter and reformat the data
-        formatted_data = []
-        for resource in resources:
-            public_ip_info = resource.get('publicip', {}).get('common', {})
-            if public_ip_info:
-                formatted_entry = {
-                    'IP Address': public_ip_info.get('resource_name'),
-                    'Metadata': public_ip_info
-                }
-                formatted_data.append(formatted_entry)
-
-        if formatted_data:
-            logging.debug(f"Retrieved and formatted {len(formatted_data)} IP addresses.")
-        else:
-            logging.debug("No IP addresses found.")
-
-        return json.dumps(formatted_data, indent=4)
-
-    except requests.exceptions.HTTPError as http_err:
-        logging.error(f"HTTP error occurred: {http_err}")
-    except requests.exceptions.ConnectionError as conn_err:
-        logging.error(f"Connection error occurred: {conn_err}")
-    except requests.exceptions.Timeout as timeout_err:
-        logging.error(f"Timeout error occurred: {timeout_err}")
-    except requests.exceptions.RequestException as req_err:
-        logging.error(f"An error occurred: {req_err}")
-    except Exception as e:
-        logging.error(f"An unexpected error occurred: {e}")
+        response = client.post("/v3/public/resource/query", json=payload, stream=True)
+        with response:
+            response.raise_for_status()  # Raises an HTTPError if the HTTP request returned an unsuccessful status code
+            for resource in iter_response_items(response, 'resources', fields):
+                received += 1
+                entry = _format_resource(resource)
+                if entry is not None:
+                    entries.append(entry)
+    except requests.exceptions.RequestException as e:
+        raise platform_error('insightcloudsec', e) from e
+    except ValueError as e:
+        raise PlatformError('insightcloudsec', f"Malformed resource query response at offset {offset}: {e}") from e
+    logging.debug(f"API call successful for offset {offset}, kept {len(entries)} resources.")
+    return entries, received, fields
+
+def _total_count(data):
+    """ Total number of matching resources reported by the query, or None if the response omits it """
+    counts = data.get('counts')
+    if isinstance(counts, dict) and counts:
+        return counts.get('publicip', sum(value for value in counts.values() if isinstance(value, int)))
+    for key in ('total_count', 'total'):
+        if isinstance(data.get(key), int):
+            return data[key]
+    return None
+
+def _project_metadata(public_ip_info):
+    """ The publicip.common keys metadata routing reads; the rest of each resource is dropped """
+    return {key: public_ip_info[key] for key in METADATA_KEYS if key in public_ip_info}
+
+def _format_resource(resource):
+    public_ip_info = resource.get('publicip', {}).get('common', {})
+    if not public_ip_info:
+        return None
+    entry = {
+        'IP Address': public_ip_info.get('resource_name'),
+        'Metadata': _project_metadata(public_ip_info)
+    }
+    # Resource-level tags are kept alongside for metadata routing
+    if resource.get('tags'):
+        entry['Tags'] = resource['tags']
+    return entry
+
+def iter_insightcloudsec_ips(page_size=None, max_workers=None):
+    """
+    Stream every public IP resource, one formatted entry at a time.
+
+    The first page reports the total; the remaining pages are then fetched concurrently with at
+    most `max_workers` requests in flight and yielded as each page completes. Pages are stepped
+    by the number of resources the first page actually held, since the server may cap pages
+    below `page_size`. A failed page, or a received count that differs from the reported total,
+    raises PlatformError rather than truncating the inventory.
+    """
+    page_size = page_size or INSIGHTCLOUDSEC_PAGE_SIZE
+    max_workers = max_workers or INSIGHTCLOUDSEC_MAX_WORKERS
+    client = get_client('insightcloudsec')
+
+    first_page, received, first_fields = _fetch_page(client, 0, page_size)
+    yield from first_page
+    del first_page
+    total = _total_count(first_fields)
+    # The server's page cap: a first page shorter than requested is either the cap or the end
+    step = received
+
+    if total is None:
+        # No total reported: walk the pages sequentially until a short or empty page
+        offset = received
+        page_length = received
+        while page_length and page_length >= step:
+            page, page_length, _ = _fetch_page(client, offset, page_size)
+            offset += page_length
+            yield from page
+        return
+
+    if received < total:
+        if not step:
+            raise PlatformError('insightcloudsec', f"The first page was empty although the query reported {total} resources.")
+        offsets = range(step, total, step)
+        logging.debug(f"InsightCloudSec reports {total} resources, fetching {len(offsets)} more pages of {step}.")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(_fetch_page, client, offset, page_size) for offset in offsets]
+            try:
+                for future in as_completed(futures):
+                    page, page_length, _ = future.result()
+                    received += page_length
+                    yield from page
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    if received != total:
+        # A partial inventory would turn every missing address into a removal
+        raise PlatformError('insightcloudsec', f"Received {received} resources but the query reported {total}.")
+
+def get_insightcloudsec_ips():
+    """ Every public IP resource as a list of {'IP Address', 'Metadata'} entries (Metadata projected to METADATA_KEYS); raises PlatformError """
+    formatted_data = list(iter_insightcloudsec_ips())
+
+    if formatted_data:
+        logging.debug(f"Retrieved and formatted {len(formatted_data)} IP addresses.")
+    else:
+        logging.debug("No IP addresses found.")
+
+    return formatted_data
 
 # Call the function and print the result
 if __name__ == "__main__":
-    public_ips_json = get_insightcloudsec_ips()
-    if public_ips_json:
-        print(public_ips_json)
\ No newline at end of file
+    configure_logging()
+    print(json.dumps(get_insightcloudsec_ips(), indent=4))
\ No newline at end of file
@@ -0,0 +1,206 @@
+# filename: http_client.py
+import os
+import time
+import random
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+from urllib3.exceptions import InsecureRequestWarning
+from results import PlatformError
+from rate_limit import get_rate_limiter, get_rate_controller, endpoint_name
+from metrics import metrics
+
+# Retry/backoff policy shared by every platform
+HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', '5'))
+HTTP_BACKOFF_BASE = float(os.getenv('HTTP_BACKOFF_BASE', '1'))
+HTTP_BACKOFF_CAP = float(os.getenv('HTTP_BACKOFF_CAP', '60'))
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', '60'))
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '10'))
+
+# Stated explicitly for the large inventory and catalogue reads; streamed bodies are decoded as they arrive
+COMPRESSED_ENCODINGS = 'gzip, deflate'
+
+# Statuses worth retrying: rate limiting and transient gateway errors
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+
+# InsightVM and Shodan are called with certificate validation disabled
+requests.packages.urllib3.disable_warnings(category=InsecureRequestWarning)
+
+
+def parse_retry_after(value):
+    """ Return the Retry-After header as seconds, accepting both delta-seconds and HTTP-date forms """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def backoff_delay(attempt, retry_after=None):
+    """ Capped exponential backoff with full jitter; an explicit Retry-After wins (still capped) """
+    if retry_after is not None:
+        return min(HTTP_BACKOFF_CAP, retry_after)
+    return random.uniform(0, min(HTTP_BACKOFF_CAP, HTTP_BACKOFF_BASE * 2 ** attempt))
+
+
+class PlatformClient:
+    """ A pooled, keep-alive session for one platform with bounded, non-recursive retries """
+
+    def __init__(self, platform, base_url, auth=None, headers=None, params=None, verify=True):
+        self.platform = platform
+        self.rate_limiter = get_rate_limiter(platform)
+        self.base_url = (base_url or '').rstrip('/')
+        self.session = requests.Session()
+        self.session.verify = verify
+        self.session.auth = auth
+        self.session.headers.update(headers or {})
+        self.session.params = params or {}
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(self, method, path, **kwargs):
+        """
+        Send a request, retrying 429/5xx responses and connection errors up to HTTP_MAX_RETRIES
+        times. Every attempt first takes a token from the platform's shared rate limiter, so
+        concurrent workers stay under the API quota together, and from the endpoint's adaptive
+        controller, which slows down on 429s and probes back up after successes. The final
+        response is returned as-is so callers keep their own status handling.
+        """
+        url = f"{self.base_url}{path}"
+        kwargs.setdefault('timeout', HTTP_TIMEOUT)
+        controller = get_rate_controller(self.platform, method, path)
+        labels = {'platform': self.platform, 'endpoint': endpoint_name(method, path)}
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            controller.acquire()
+            started = time.monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                metrics.increment('http_requests_total', status='error', **labels)
+                if attempt >= HTTP_MAX_RETRIES:
+                    raise
+                delay = backoff_delay(attempt)
+                logging.warning(f"{self.platform} {method} {path} failed ({e}), retrying in {delay:.1f}s.")
+            else:
+                self._record_response(response, time.monotonic() - started, labels, streamed=kwargs.get('stream', False))
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                if response.status_code == 429:
+                    metrics.increment('http_throttled_total', **labels)
+                    controller.record_throttled(retry_after)
+                elif response.status_code < 500:
+                    controller.record_success()
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= HTTP_MAX_RETRIES:
+                    return response
+                delay = backoff_delay(attempt, retry_after)
+                logging.warning(f"{self.platform} {method} {path} returned {response.status_code}, retrying in {delay:.1f}s.")
+                response.close()
+            metrics.increment('http_retries_total', **labels)
+            time.sleep(delay)
+            attempt += 1
+
+    @staticmethod
+    def _record_response(response, elapsed, labels, streamed=False):
+        metrics.increment('http_requests_total', status=response.status_code, **labels)
+        metrics.observe('http_request', elapsed, **labels)
+        body = response.request.body
+        if body:
+            metrics.increment('http_bytes_sent_total', len(body), **labels)
+        # A streamed body is not read here; its declared length is the best estimate
+        received = response.headers.get('Content-Length')
+        if received is None and not streamed:
+            received = len(response.content)
+        if received:
+            metrics.increment('http_bytes_received_total', int(received), **labels)
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request('PUT', path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request('DELETE', path, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+def platform_error(platform, error):
+    """ Convert a requests exception into a PlatformError carrying the HTTP status, if any """
+    response = getattr(error, 'response', None)
+    return PlatformError(platform, str(error), response.status_code if response is not None else None)
+
+
+def _build_client(platform):
+    if platform == 'insightcloudsec':
+        return PlatformClient(
+            platform,
+            os.getenv('INSIGHTCLOUDSEC_BASE_URL'),
+            headers={
+                'Content-Type': 'application/json',
+                'Accept': 'application/json',
+                'Accept-Encoding': COMPRESSED_ENCODINGS,
+                'Api-Key': os.getenv('INSIGHTCLOUDSEC_API_KEY')
+            }
+        )
+    if platform == 'insightvm':
+        return PlatformClient(
+            platform,
+            os.getenv('INSIGHTVM_BASE_URL'),
+            auth=HTTPBasicAuth(os.getenv('INSIGHTVM_USERNAME'), os.getenv('INSIGHTVM_PASSWORD')),
+            headers={'Content-Type': 'application/json'},
+            verify=False
+        )
+    if platform == 'shodan':
+        return PlatformClient(
+            platform,
+            os.getenv('SHODAN_BASE_URL'),
+            headers={'Accept-Encoding': COMPRESSED_ENCODINGS},
+            params={'key': os.getenv('SHODAN_API_KEY')},
+            verify=False
+        )
+    if platform == 'cloudflare':
+        return PlatformClient(
+            platform,
+            os.getenv('CLOUDFLARE_BASE_URL', 'https://api.cloudflare.com'),
+            headers={'Accept': 'application/json'}
+        )
+    raise ValueError(f"Unknown platform: {platform}")
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(platform):
+    """ Return the shared client for a platform, creating it on first use in this process """
+    with _clients_lock:
+        client = _clients.get(platform)
+        if client is None:
+            client = _clients[platform] = _build_client(platform)
+        return client
+
+
+def close_clients():
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
@@ -0,0 +1,103 @@
+# filename: insightvm_batches.py
+import os
+import logging
+from ip_set import IPSet, ADDRESS_CLASSES
+from results import IPOutcome
+from metrics import metrics
+
+# Number of collapsed targets sent per included_targets request
+INSIGHTVM_BATCH_SIZE = int(os.getenv('INSIGHTVM_BATCH_SIZE', '500'))
+
+# HTTP statuses that mean the payload itself was rejected, so splitting it can isolate the bad entries
+REJECTED_STATUS_CODES = {400, 409, 422}
+
+
+def format_target(interval):
+    """ Render a (version, first, last) interval as an InsightVM target: single IP, CIDR or 'first - last' range """
+    version, first, last = interval
+    address_class = ADDRESS_CLASSES[version]
+    if first == last:
+        return str(address_class(first))
+    size = last - first + 1
+    if size & (size - 1) == 0 and first % size == 0:
+        prefix = (32 if version == 4 else 128) - (size.bit_length() - 1)
+        return f"{address_class(first)}/{prefix}"
+    return f"{address_class(first)} - {address_class(last)}"
+
+
+def collapse_targets(ips):
+    """ Collapse an IPSet or an iterable of IP strings into merged intervals """
+    ip_set = ips if isinstance(ips, IPSet) else IPSet(ips)
+    return ip_set.intervals()
+
+
+def _split(chunk):
+    """ Halve a chunk of intervals; collapsed targets themselves are never split """
+    middle = len(chunk) // 2
+    return [chunk[:middle], chunk[middle:]]
+
+
+def _send_chunk_with_bisect(chunk, send_chunk, on_success=None, key=None, on_outcome=None):
+    """
+    Send one chunk of intervals, bisecting it on a validation rejection; returns its IPOutcomes,
+    or passes each to `on_outcome` instead and returns an empty list. `on_success` is called
+    with the IPSet of every (sub)chunk the platform acknowledged.
+    """
+    pending = [chunk]
+    responses = []
+    report = responses.append if on_outcome is None else on_outcome
+
+    while pending:
+        chunk = pending.pop()
+        targets = [format_target(interval) for interval in chunk]
+        with metrics.timer('write_batch', target=key):
+            status_code, error_fields = send_chunk(targets)
+        metrics.increment('write_batches_total', target=key, status='success' if error_fields is None else 'error')
+        if error_fields is None:
+            for target, (_, first, last) in zip(targets, chunk):
+                report(IPOutcome(target, 'success', last - first + 1))
+            if on_success is not None:
+                on_success(IPSet._from_merged(chunk))
+            continue
+
+        # Bisection stops at one collapsed target: halving a rejected /16 down to its addresses
+        # would cost ~130k requests under the shared rate limit
+        if status_code in REJECTED_STATUS_CODES and len(chunk) > 1:
+            logging.debug(f"Chunk of {len(chunk)} targets rejected with HTTP {status_code}, bisecting.")
+            # Push the halves so the first half is processed next
+            pending.extend(reversed(_split(chunk)))
+            continue
+
+        for target, (_, first, last) in zip(targets, chunk):
+            report(IPOutcome(target, 'error', last - first + 1, **error_fields))
+
+    return responses
+
+
+def send_in_batches(ips, send_chunk, batch_size=None, engine=None, key=None, on_success=None, on_outcome=None):
+    """
+    Send collapsed targets in chunks of `batch_size` using `send_chunk(targets)`.
+
+    `send_chunk` returns a (status_code, error_fields) tuple: error_fields is None on success,
+    otherwise a dict of IPOutcome fields (at least 'message') for each failed target;
+    status_code is None for a transport error. A chunk rejected with a 4xx validation status
+    is bisected until the offending collapsed targets are isolated, so failures are still
+    reported per target. Returns one IPOutcome per collapsed target, in target order.
+
+    With a WriteEngine, chunks are sent concurrently on its pool; `key` names the target so
+    the engine never runs two overlapping writes to it at once. `on_success(ip_set)` is called
+    as each batch is acknowledged, so progress can be checkpointed. With `on_outcome`, each
+    IPOutcome is passed to it as its batch completes instead of being collected, and the
+    returned list is empty.
+    """
+    batch_size = batch_size or INSIGHTVM_BATCH_SIZE
+    intervals = collapse_targets(ips)
+    chunks = [intervals[i:i + batch_size] for i in range(0, len(intervals), batch_size)]
+    if engine is None:
+        return [outcome for chunk in chunks for outcome in _send_chunk_with_bisect(chunk, send_chunk, on_success, key, on_outcome)]
+
+    futures = [
+        engine.submit(key, IPSet._from_merged(chunk), _send_chunk_with_bisect, chunk, send_chunk, on_success, key, on_outcome)
+        for chunk in chunks
+    ]
+    return [outcome for future in futures for outcome in future.result()]
@@ -0,0 +1,209 @@
+# filename: ip_set.py
+import logging
+import hashlib
+from bisect import bisect_right
+from ipaddress import IPv4Address, IPv6Address, ip_address, ip_network, summarize_address_range
+
+logger = logging.getLogger(__name__)
+
+ADDRESS_CLASSES = {4: IPv4Address, 6: IPv6Address}
+
+
+def parse_entry(entry):
+    """ Convert a single IP, CIDR, 'start-end' range or integer IP string into a (version, first, last) interval """
+    entry = str(entry).strip()
+    if '-' in entry:
+        start_ip, end_ip = entry.split('-', 1)
+        start_ip = _parse_address(start_ip)
+        end_ip = _parse_address(end_ip)
+        if start_ip.version != end_ip.version:
+            raise ValueError(f"Mixed IP versions in range: {entry}")
+        first, last = sorted((int(start_ip), int(end_ip)))
+        return start_ip.version, first, last
+    if '/' in entry:
+        network = ip_network(entry, strict=False)
+        return network.version, int(network.network_address), int(network.broadcast_address)
+    address = _parse_address(entry)
+    return address.version, int(address), int(address)
+
+
+def is_ip_entry(entry):
+    """ Whether an entry parses as a single IP, CIDR or range, unlike e.g. a hostname """
+    try:
+        parse_entry(entry)
+    except ValueError:
+        return False
+    return True
+
+
+def _parse_address(value):
+    value = value.strip()
+    if value.isdigit():
+        # InsightVM occasionally reports IPv4 addresses as plain integers
+        return ip_address(int(value))
+    return ip_address(value)
+
+
+def _merge(intervals):
+    """ Sort and coalesce overlapping or adjacent intervals """
+    merged = []
+    for version, first, last in sorted(intervals):
+        if merged and merged[-1][0] == version and first <= merged[-1][2] + 1:
+            if last > merged[-1][2]:
+                merged[-1] = (version, merged[-1][1], last)
+        else:
+            merged.append((version, first, last))
+    return merged
+
+
+class IPSet:
+    """
+    A set of IPv4/IPv6 addresses stored as sorted, merged (version, first, last) integer intervals.
+
+    Union, difference, intersection and equality run in time proportional to the number of
+    intervals; iterating the set expands it into individual addresses lazily.
+    """
+    __slots__ = ('_intervals', '_starts')
+
+    def __init__(self, entries=()):
+        intervals = []
+        for entry in entries:
+            try:
+                intervals.append(parse_entry(entry))
+            except ValueError:
+                logger.error(f"Invalid IP address, subnet or range: {entry}")
+        self._set_intervals(_merge(intervals))
+
+    @classmethod
+    def from_intervals(cls, intervals):
+        ip_set = cls.__new__(cls)
+        ip_set._set_intervals(_merge(intervals))
+        return ip_set
+
+    @classmethod
+    def _from_merged(cls, intervals):
+        ip_set = cls.__new__(cls)
+        ip_set._set_intervals(intervals)
+        return ip_set
+
+    def _set_intervals(self, intervals):
+        self._intervals = intervals
+        self._starts = [(version, first) for version, first, _ in intervals]
+
+    # Set algebra
+
+    def union(self, other):
+        # Both inputs are already sorted, so a single merge pass over the concatenation suffices
+        return IPSet._from_merged(_merge(self._intervals + other._intervals))
+
+    def difference(self, other):
+        result = []
+        theirs = other._intervals
+        j = 0
+        for version, first, last in self._intervals:
+            while j < len(theirs) and (theirs[j][0], theirs[j][2]) < (version, first):
+                j += 1
+            k = j
+            while first <= last and k < len(theirs) and (theirs[k][0], theirs[k][1]) <= (version, last):
+                _, other_first, other_last = theirs[k]
+                if other_first > first:
+                    result.append((version, first, other_first - 1))
+                first = max(first, other_last + 1)
+                k += 1
+            if first <= last:
+                result.append((version, first, last))
+        return IPSet._from_merged(result)
+
+    def intersection(self, other):
+        result = []
+        mine, theirs = self._intervals, other._intervals
+        i = j = 0
+        while i < len(mine) and j < len(theirs):
+            a_version, a_first, a_last = mine[i]
+            b_version, b_first, b_last = theirs[j]
+            if a_version == b_version:
+                first, last = max(a_first, b_first), min(a_last, b_last)
+                if first <= last:
+                    result.append((a_version, first, last))
+            if (a_version, a_last) < (b_version, b_last):
+                i += 1
+            else:
+                j += 1
+        return IPSet._from_merged(result)
+
+    __or__ = union
+    __sub__ = difference
+    __and__ = intersection
+
+    def __contains__(self, ip):
+        try:
+            version, first, last = parse_entry(ip)
+        except ValueError:
+            return False
+        index = bisect_right(self._starts, (version, first)) - 1
+        if index < 0:
+            return False
+        interval_version, _, interval_last = self._intervals[index]
+        return interval_version == version and last <= interval_last
+
+    def __eq__(self, other):
+        if not isinstance(other, IPSet):
+            return NotImplemented
+        return self._intervals == other._intervals
+
+    def __hash__(self):
+        return hash(tuple(self._intervals))
+
+    def __bool__(self):
+        return bool(self._intervals)
+
+    # Introspection and lazy expansion
+
+    @property
+    def num_addresses(self):
+        """ Total number of addresses; may exceed sys.maxsize for IPv6, which is why there is no __len__ """
+        return sum(last - first + 1 for _, first, last in self._intervals)
+
+    @property
+    def num_ranges(self):
+        return len(self._intervals)
+
+    def intervals(self):
+        return list(self._intervals)
+
+    def digest(self):
+        """ Stable content digest of the merged intervals, independent of how the input was written """
+        hasher = hashlib.sha256()
+        for version, first, last in self._intervals:
+            hasher.update(f"{version}:{first:x}-{last:x};".encode())
+        return hasher.hexdigest()
+
+    def ranges(self):
+        """ Yield (first, last) ipaddress objects for every merged interval """
+        for version, first, last in self._intervals:
+            address_class = ADDRESS_CLASSES[version]
+            yield address_class(first), address_class(last)
+
+    def cidrs(self):
+        """ Yield the minimal list of CIDR networks covering the set """
+        for first, last in self.ranges():
+            yield from summarize_address_range(first, last)
+
+    def to_strings(self):
+        """ Compact string form: single addresses, or 'first-last' ranges """
+        entries = []
+        for first, last in self.ranges():
+            entries.append(str(first) if first == last else f"{first}-{last}")
+        return entries
+
+    def __iter__(self):
+        """ Lazily expand the set into individual dotted-quad (or IPv6) address strings """
+        for version, first, last in self._intervals:
+            address_class = ADDRESS_CLASSES[version]
+            for value in range(first, last + 1):
+                yield str(address_class(value))
+
+    def __repr__(self):
+        preview = self.to_strings()[:5]
+        suffix = ', ...' if self.num_ranges > 5 else ''
+        return f"IPSet([{', '.join(repr(entry) for entry in preview)}{suffix}])"
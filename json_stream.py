@@ -0,0 +1,134 @@
+# filename: json_stream.py
+import os
+import json
+import codecs
+
+# Bytes read from a streamed response body per step of the incremental parser
+JSON_STREAM_CHUNK_SIZE = int(os.getenv('JSON_STREAM_CHUNK_SIZE', '65536'))
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+# What a number cut off at the end of a buffer may leave undecoded after it
+_NUMBER_CONTINUATIONS = {'', '.', 'e', 'E', 'e-', 'E-', 'e+', 'E+'}
+
+
+class _Reader:
+    """
+    A rolling text buffer over a stream of byte chunks. Values are decoded one at a time with
+    raw_decode, and text that has been consumed is dropped whenever more is read, so the buffer
+    only ever holds the value being parsed plus one chunk.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decode = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        """ Append the next chunk of text; returns False once the input is exhausted """
+        while not self.eof:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self.eof = True
+                text = self._decode.decode(b'', final=True)
+            else:
+                text = self._decode.decode(chunk)
+            if text:
+                self.buffer = self.buffer[self.pos:] + text
+                self.pos = 0
+                return True
+        return False
+
+    def peek(self):
+        """ The next non-whitespace character, or '' at the end of the input """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} in JSON stream, found {found or 'end of input'!r}")
+        self.pos += 1
+
+    def value(self):
+        """ Decode the next complete JSON value, reading more input until it is whole """
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A value ending exactly at the buffer's end may continue in the next chunk, and
+            # raw_decode stops a number before a trailing '.', 'e' or 'e-' it cannot complete yet
+            cut_off = end == len(self.buffer) or (isinstance(value, (int, float)) and self.buffer[end:] in _NUMBER_CONTINUATIONS)
+            if cut_off and self._fill():
+                continue
+            self.pos = end
+            return value
+
+
+def _array_items(reader):
+    reader.expect('[')
+    if reader.peek() == ']':
+        reader.pos += 1
+        return
+    while True:
+        yield reader.value()
+        separator = reader.peek()
+        reader.pos += 1
+        if separator == ']':
+            return
+        if separator != ',':
+            raise ValueError(f"Expected ',' or ']' in JSON array, found {separator or 'end of input'!r}")
+
+
+def iter_array(chunks):
+    """ Yield the items of a top-level JSON array one at a time from an iterable of byte chunks """
+    yield from _array_items(_Reader(chunks))
+
+
+def iter_object_array(chunks, key, fields=None):
+    """
+    Yield the items of the array under `key` in a top-level JSON object one at a time. Every
+    other top-level member is decoded whole and stored in `fields`, if given, as it is passed;
+    members after the array are only available once the generator is exhausted.
+    """
+    reader = _Reader(chunks)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        name = reader.value()
+        reader.expect(':')
+        if name == key and reader.peek() == '[':
+            yield from _array_items(reader)
+        else:
+            value = reader.value()
+            if fields is not None:
+                fields[name] = value
+        separator = reader.peek()
+        reader.pos += 1
+        if separator == '}':
+            return
+        if separator != ',':
+            raise ValueError(f"Expected ',' or '}}' in JSON object, found {separator or 'end of input'!r}")
+
+
+def iter_response_items(response, key=None, fields=None):
+    """
+    Stream the items of a JSON response's top-level array, or of the array under `key` in its
+    top-level object, without holding the raw body. Compressed bodies are decoded on the fly.
+    """
+    chunks = response.iter_content(chunk_size=JSON_STREAM_CHUNK_SIZE)
+    if key is None:
+        return iter_array(chunks)
+    return iter_object_array(chunks, key, fields)
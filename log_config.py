@@ -0,0 +1,43 @@
+# filename: log_config.py
+import os
+import logging
+from itertools import islice
+
+# Addresses or ranges quoted when a large IP set is summarized in a log record
+LOG_SAMPLE_SIZE = int(os.getenv('LOG_SAMPLE_SIZE', '5'))
+
+LOG_FORMAT = '[%(levelname)s] %(asctime)s, %(message)s'
+LOG_DATE_FORMAT = '%m/%d/%Y %H:%M:%S'
+
+
+def configure_logging(level=None):
+    """
+    The single logging configuration for every entry point, from LOGGING_LEVEL (default INFO).
+    Library modules only create records; they never configure handlers themselves.
+    """
+    level = level or os.getenv('LOGGING_LEVEL', 'INFO')
+    # Values may carry a trailing ')' from the way some schedulers quote them
+    level = level[:-1] if level.endswith('))') else level
+    numeric_level = getattr(logging, level.upper(), None)
+    if not isinstance(numeric_level, int):
+        raise ValueError(f'Invalid log level: {level}')
+    logging.basicConfig(level=numeric_level, format=LOG_FORMAT, datefmt=LOG_DATE_FORMAT, force=True)
+    # Connection pool chatter would otherwise drown the sync's own DEBUG output
+    logging.getLogger('urllib3').setLevel(max(numeric_level, logging.INFO))
+
+
+def summarize_ips(ip_set, sample_size=None):
+    """ A bounded description of an IPSet for logs: sizes, digest and the first few ranges """
+    if not ip_set:
+        return {'addresses': 0, 'ranges': 0}
+    sample_size = LOG_SAMPLE_SIZE if sample_size is None else sample_size
+    sample = [
+        str(first) if first == last else f"{first}-{last}"
+        for first, last in islice(ip_set.ranges(), sample_size)
+    ]
+    return {
+        'addresses': ip_set.num_addresses,
+        'ranges': ip_set.num_ranges,
+        'digest': ip_set.digest()[:12],
+        'sample': sample,
+    }
@@ -1,57 +1,203 @@
 import os
-import json
+import uuid
+import argparse
 import logging
+import threading
 from datetime import datetime
-from calculate_changes import calculate_changes
+from concurrent.futures import ThreadPoolExecutor
+from calculate_changes import record_applied_changes
+from change_plan import ApplyCheckpoint, complete_targets, prepare_changes
+from fetch_stage import FetchError
+from sync_plan import SyncPlanError, describe_target, load_sync_plan
 from add_ips_to_insightvm_site import add_ips_to_insightvm_site
 from remove_ips_from_insightvm_site import remove_ips_from_insightvm_site
 from replace_ips_in_shodan_net import replace_ips_in_shodan_net
+from replace_ips_in_insightvm_site import replace_ips_in_insightvm_site
+from change_planner import REPLACE, plan_insightvm_change
+from results import IPOutcome, PlatformError
+from audit_log import AuditSink
+from write_engine import get_write_engine
+from snapshot_store import SnapshotStore
+from rate_limit import current_rates, load_learned_rates
+from log_config import configure_logging
+from metrics import export_metrics, metrics
 
 def get_env_variable(var_name, default=None):
     """ Retrieve environment variables and handle those that may end with double parentheses """
     env_var = os.getenv(var_name, default)
     return env_var[:-1] if env_var and env_var.endswith('))') else env_var
 
-# Set up structured logging  
-logging_level = get_env_variable('LOGGING_LEVEL', 'INFO')  # Default to INFO if not set
-numeric_level = getattr(logging, logging_level.upper(), None)
-if not isinstance(numeric_level, int):
-    raise ValueError(f'Invalid log level: {logging_level}')
-logging.basicConfig(level=numeric_level, format='[%(levelname)s] %(asctime)s, %(message)s', datefmt='%m/%d/%Y %H:%M:%S')
-
 # Environment variables for network names and site IDs  
-SHODAN_AZURE_AWS_NET = get_env_variable('SHODAN_AZURE_AWS_NET')  
 INSIGHTVM_AZURE_AWS_SITE_ID = get_env_variable('INSIGHTVM_AZURE_AWS_SITE_ID')  
-  
-changes = calculate_changes(INSIGHTVM_AZURE_AWS_SITE_ID, SHODAN_AZURE_AWS_NET)  
+
+# Held while a sync cycle runs, so cycles never overlap
+_cycle_lock = threading.Lock()
 
 def log_result(ip, target_location, action, result):
-    if 'status' in result and result['status'] == 'success':
+    if result.ok:
         logging.info(f"{ip}, {target_location}, {action}, Success")
         return 'Success'
     else:
-        error_message = result.get('message', 'Unknown error')
+        error_message = result.message or 'Unknown error'
         logging.error(f"{ip}, {target_location}, {action}, FAILURE, {error_message}")
         return 'FAILURE'
-  
-def implement_changes():
-    successes = 0
-    failures = 0
-    for change_key, site_id, action in [
-        ('insightvm_insightcloudsec_additions', INSIGHTVM_AZURE_AWS_SITE_ID, "Addition"),
-        ('insightvm_insightcloudsec_removals', INSIGHTVM_AZURE_AWS_SITE_ID, "Removal"),
-    ]:
-        if changes.get(change_key):
-            func = add_ips_to_insightvm_site if action == "Addition" else remove_ips_from_insightvm_site
-            results = json.loads(func(changes[change_key], site_id))
-            for result in results:
-                if result['status'] == 'success':
-                    logging.info(f"{result['ip']}, InsightVM Site {site_id}, {action}, Success")
-                    successes += 1
-                else:
-                    logging.error(f"{result['ip']}, InsightVM Site {site_id}, {action}, FAILURE, {result.get('message', 'Unknown error')}")
-                    failures += 1
 
+def outcome_recorder(audit, change, action):
+    """ A callback that logs each outcome of one target and action and streams it to the audit sink """
+    target_location = describe_target(change.target)
+    def record(outcome):
+        log_result(outcome.ip, target_location, action, outcome)
+        audit.record(change.key, target_location, action, outcome)
+    return record
+
+def apply_insightvm_change(change, checkpoint, audit):
+    site_id = change.target['site_id']
+    # Pick the cheaper of batched additions/removals and a full replacement of the site's targets
+    strategy = change.strategy or plan_insightvm_change(change)['strategy']
+    if strategy == REPLACE:
+        if checkpoint.acknowledged(change.key, "Replace"):
+            # Once the PUT was acknowledged, a resumed replace only has overflow batches left to append
+            remaining = change.source_ips - checkpoint.done(change.key, "Replace")
+            steps = [(remaining, add_ips_to_insightvm_site, "Replace")] if remaining else []
+        else:
+            # Sent even for an empty source: the PUT is what clears the site's stale targets
+            steps = [(change.source_ips, replace_ips_in_insightvm_site, "Replace")]
+    else:
+        steps = [
+            (change.additions, add_ips_to_insightvm_site, "Addition"),
+            (change.removals, remove_ips_from_insightvm_site, "Removal"),
+        ]
+        # Batches acknowledged before an interrupted run are not sent again
+        steps = [(ips - checkpoint.done(change.key, action) if ips else ips, func, action) for ips, func, action in steps]
+        steps = [(ips, func, action) for ips, func, action in steps if ips]
+    # Additions and removals share the write engine's pool and rate limit; they are disjoint by
+    # construction, and the engine's ordering guard keeps any overlapping writes to a site serial
+    engine = get_write_engine()
+    with ThreadPoolExecutor(max_workers=max(1, len(steps))) as executor:
+        futures = [
+            executor.submit(
+                func, ips, site_id, engine=engine,
+                on_success=checkpoint.recorder(change.key, action),
+                on_outcome=outcome_recorder(audit, change, action),
+            )
+            for ips, func, action in steps
+        ]
+        for future in futures:
+            future.result()
+    return audit.totals(change.key)
+
+def apply_shodan_change(change, checkpoint, audit):
+    alert_name = change.target['alert']
+    if checkpoint.acknowledged(change.key, "Replace"):
+        logging.debug(f"{describe_target(change.target)} was already replaced under this change plan.")
+        return 0, 0
+    # The writer collapses the set to CIDRs itself and skips the POST when the alert already matches
+    # The alert is written as a whole, so its outcome counts every address in it
+    count = change.source_ips.num_addresses
+    try:
+        replace_ips_in_shodan_net(change.source_ips, alert_name)
+        result = IPOutcome(alert_name, 'success', count)
+        checkpoint.recorder(change.key, "Replace")(change.source_ips)
+    except PlatformError as e:
+        result = IPOutcome(alert_name, 'error', count, message=str(e), http_status=e.status_code)
+    outcome_recorder(audit, change, "Replace")(result)
+    return audit.totals(change.key)
+
+APPLY_FUNCTIONS = {
+    'insightvm': apply_insightvm_change,
+    'shodan': apply_shodan_change,
+}
+
+def apply_change(change, store, checkpoint, audit):
+    if change.is_empty:
+        return 0, 0
+    with metrics.timer('phase', phase='apply', name=change.key):
+        successes, failures = APPLY_FUNCTIONS[change.target['type']](change, checkpoint, audit)
+    metrics.increment('applied_addresses_total', successes, target=change.key, status='success')
+    metrics.increment('applied_addresses_total', failures, target=change.key, status='failure')
+    # Only a clean apply lets the next run trust the target contents without refetching them
+    if audit.clean(change.key):
+        record_applied_changes(change, store)
+    return successes, failures
+
+def implement_changes(plan, changes, store, checkpoint, audit=None):
+    """
+    Apply every change; returns (successes, failures) in addresses. Each outcome is streamed to
+    `audit` (by default a sink appending to AUDIT_LOG_PATH) as it happens, and the summary is
+    computed from the sink's counters rather than from collected results.
+    """
+    audit = audit or AuditSink(run_id=uuid.uuid4().hex[:12])
+    try:
+        # Independent targets are written in parallel, bounded by the plan's global concurrency limit
+        with ThreadPoolExecutor(max_workers=plan['max_workers']) as executor:
+            list(executor.map(lambda change: apply_change(change, store, checkpoint, audit), changes))
+    finally:
+        audit.close()
+
+    for row in audit.summary():
+        logging.info(f"{row['target']}, {row['action']}, {row['status']}: {row['addresses']} addresses in {row['targets']} targets")
+    successes, failures = audit.totals()
     logging.info(f"Synchronization completed with {successes} successes and {failures} failures.")
+    return successes, failures
+
+def run_cycle(plan, store, plan_only=False):
+    """
+    Fetch, diff and apply every pair of `plan` once. Raises SyncPlanError/FetchError without
+    writing anything when an input is missing. Returns (successes, failures), or None when
+    another cycle is still running or `plan_only` is set.
+
+    The diff is written as a change plan first and each acknowledged batch is checkpointed, so
+    an interrupted apply resumes where it stopped; a target's entry is removed from the plan
+    once it is applied cleanly.
+    """
+    if not _cycle_lock.acquire(blocking=False):
+        logging.warning("A synchronization cycle is already running; skipping this one.")
+        return None
+    # Every run or daemon cycle exports its own metrics
+    metrics.reset()
+    try:
+        change_plan, changes = prepare_changes(plan, store)
+        if plan_only:
+            pending = sum(1 for change in changes if not change.is_empty)
+            logging.info(f"Change plan has changes for {pending} of {len(changes)} targets; not applied.")
+            return None
+        checkpoint = ApplyCheckpoint(store, {change.key: change_plan['targets'][change.key]['digest'] for change in changes})
+        audit = AuditSink(run_id=uuid.uuid4().hex[:12])
+        successes, failures = implement_changes(plan, changes, store, checkpoint, audit)
+        # Failed targets keep their entries and checkpoints for the next cycle that covers them
+        complete_targets(change_plan, [change.key for change in changes if audit.clean(change.key)], store)
+        return successes, failures
+    finally:
+        rates = current_rates()
+        store.record_rates(rates)
+        for endpoint, rate in sorted(rates.items()):
+            logging.debug(f"Request rate for {endpoint}: {rate:.2f}/s")
+            metrics.set_gauge('request_rate', round(rate, 3), endpoint=endpoint)
+        try:
+            export_metrics()
+        except OSError as e:
+            logging.error(f"Could not write metrics: {e}")
+        _cycle_lock.release()
+
+def main(argv=None):
+    """ Run one synchronization cycle and exit, e.g. from cron """
+    parser = argparse.ArgumentParser(description="Synchronize IP lists between the configured sources and targets.")
+    parser.add_argument('--plan-only', action='store_true', help="write the change plan for review without applying it")
+    args = parser.parse_args(argv)
+
+    configure_logging()
+    # Start every endpoint at the request rate the previous run learned it could sustain
+    store = SnapshotStore()
+    load_learned_rates(store.get_rates())
+    try:
+        plan = load_sync_plan(default_site_id=INSIGHTVM_AZURE_AWS_SITE_ID)
+        run_cycle(plan, store, plan_only=args.plan_only)
+    except (SyncPlanError, FetchError) as e:
+        # Never apply a diff computed against a missing source or target
+        logging.error(f"Synchronization aborted: {e}")
+        raise SystemExit(1)
+    finally:
+        store.close()
 
-implement_changes()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# filename: metadata_index.py
+from ip_set import IPSet
+
+# Routing fields and the InsightCloudSec publicip.common keys they are read from
+INDEXED_FIELDS = {
+    'cloud': ('cloud', 'cloud_type'),
+    'account': ('account', 'account_id'),
+    'region': ('region_name', 'region'),
+}
+ROUTING_FIELDS = set(INDEXED_FIELDS) | {'tags'}
+
+
+def _normalize(value):
+    return str(value).strip().lower()
+
+
+def _tags(metadata):
+    """ Tags as a dict, whether given as a mapping or as a list of {'key': ..., 'value': ...} entries """
+    tags = metadata.get('tags') or {}
+    if isinstance(tags, list):
+        return {tag.get('key'): tag.get('value') for tag in tags if isinstance(tag, dict) and tag.get('key')}
+    return tags if isinstance(tags, dict) else {}
+
+
+class MetadataIndex:
+    """
+    In-memory index of one InsightCloudSec inventory pull by cloud, account, region and tags.
+
+    Each (field, value) maps to the IPSet of addresses carrying it, so a routing rule resolves
+    to set unions and intersections instead of rescanning the inventory per target site.
+    """
+
+    def __init__(self, entries=()):
+        self._pending = {}
+        self._postings = {}
+        self._all = []
+        self._ip_set = IPSet()
+        for entry in entries:
+            self.add(entry['IP Address'], entry.get('Metadata') or {}, entry.get('Tags'))
+
+    def add(self, ip, metadata, tags=None):
+        if not ip:
+            return
+        self._all.append(ip)
+        for field, keys in INDEXED_FIELDS.items():
+            for key in keys:
+                if metadata.get(key) not in (None, ''):
+                    self._pending.setdefault((field, _normalize(metadata[key])), []).append(ip)
+        for key, value in (_tags(metadata) or _tags({'tags': tags})).items():
+            self._pending.setdefault((f"tag:{_normalize(key)}", '*'), []).append(ip)
+            if value not in (None, ''):
+                self._pending.setdefault((f"tag:{_normalize(key)}", _normalize(value)), []).append(ip)
+
+    def _finalize(self):
+        for posting, ips in self._pending.items():
+            ip_set = IPSet(ips)
+            self._postings[posting] = self._postings[posting] | ip_set if posting in self._postings else ip_set
+        self._pending = {}
+        if self._all:
+            self._ip_set = self._ip_set | IPSet(self._all)
+            self._all = []
+
+    @property
+    def ip_set(self):
+        """ Every address in the inventory, regardless of metadata """
+        self._finalize()
+        return self._ip_set
+
+    def _lookup(self, field, values):
+        values = values if isinstance(values, (list, tuple, set)) else [values]
+        result = IPSet()
+        for value in values:
+            result = result | self._postings.get((field, _normalize(value)), IPSet())
+        return result
+
+    def select(self, where=None):
+        """
+        Resolve a routing rule such as {'cloud': 'AWS', 'account': ['prod-1', 'prod-2'],
+        'tags': {'env': 'prod'}} to an IPSet. A list of values matches any of them, criteria are
+        combined with AND, and a tag value of '*' only requires the tag to be present.
+        """
+        self._finalize()
+        result = self._ip_set
+        for field, values in (where or {}).items():
+            if field == 'tags':
+                for key, value in values.items():
+                    result = result & self._lookup(f"tag:{_normalize(key)}", value if value is not None else '*')
+            else:
+                result = result & self._lookup(field, values)
+        return result
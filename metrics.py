@@ -0,0 +1,120 @@
+# filename: metrics.py
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+# Where each run's metrics are written: a '.json' path gets a JSON summary, anything else the
+# Prometheus textfile format (for node_exporter's textfile collector). Empty disables the export.
+METRICS_PATH = os.getenv('METRICS_PATH', '')
+METRICS_PREFIX = 'ip_sync_'
+
+
+class MetricsRegistry:
+    """
+    Thread-safe counters, gauges and timers for one run or daemon cycle, keyed by name and labels.
+
+    Timers keep a count, total and maximum, which is enough to alert on throughput and latency
+    regressions without storing every observation.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counters = {}
+            self._gauges = {}
+            self._timers = {}
+            self._started_at = time.time()
+
+    @staticmethod
+    def _key(metric, labels):
+        return metric, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def increment(self, metric, value=1, **labels):
+        key = self._key(metric, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, metric, value, **labels):
+        with self._lock:
+            self._gauges[self._key(metric, labels)] = value
+
+    def observe(self, metric, seconds, **labels):
+        key = self._key(metric, labels)
+        with self._lock:
+            count, total, maximum = self._timers.get(key, (0, 0.0, 0.0))
+            self._timers[key] = (count + 1, total + seconds, max(maximum, seconds))
+
+    @contextmanager
+    def timer(self, metric, **labels):
+        """ Time the enclosed block into timer `metric`, whether or not it raises """
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(metric, time.monotonic() - started, **labels)
+
+    def snapshot(self):
+        """ JSON-ready copy of every metric, with the run's start and export time """
+        with self._lock:
+            return {
+                'started_at': self._started_at,
+                'exported_at': time.time(),
+                'counters': [{'name': name, 'labels': dict(labels), 'value': value} for (name, labels), value in sorted(self._counters.items())],
+                'gauges': [{'name': name, 'labels': dict(labels), 'value': value} for (name, labels), value in sorted(self._gauges.items())],
+                'timers': [
+                    {'name': name, 'labels': dict(labels), 'count': count, 'sum': total, 'max': maximum}
+                    for (name, labels), (count, total, maximum) in sorted(self._timers.items())
+                ],
+            }
+
+    def to_prometheus(self):
+        """ Render the metrics in the Prometheus text exposition format """
+        snapshot = self.snapshot()
+        lines = []
+
+        def add(name, kind, samples):
+            lines.append(f"# TYPE {METRICS_PREFIX}{name} {kind}")
+            for labels, value in samples:
+                rendered = ','.join(f'{key}="{_escape(label)}"' for key, label in labels.items())
+                lines.append(f"{METRICS_PREFIX}{name}{{{rendered}}} {value}" if rendered else f"{METRICS_PREFIX}{name} {value}")
+
+        for kind, section in (('counter', 'counters'), ('gauge', 'gauges')):
+            for name in sorted({metric['name'] for metric in snapshot[section]}):
+                add(name, kind, [(metric['labels'], metric['value']) for metric in snapshot[section] if metric['name'] == name])
+        for name in sorted({metric['name'] for metric in snapshot['timers']}):
+            timers = [metric for metric in snapshot['timers'] if metric['name'] == name]
+            add(f"{name}_seconds_count", 'counter', [(metric['labels'], metric['count']) for metric in timers])
+            add(f"{name}_seconds_sum", 'counter', [(metric['labels'], f"{metric['sum']:.6f}") for metric in timers])
+            add(f"{name}_seconds_max", 'gauge', [(metric['labels'], f"{metric['max']:.6f}") for metric in timers])
+        add('last_run_timestamp_seconds', 'gauge', [({}, f"{snapshot['exported_at']:.0f}")])
+        add('last_run_duration_seconds', 'gauge', [({}, f"{snapshot['exported_at'] - snapshot['started_at']:.3f}")])
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+metrics = MetricsRegistry()
+
+
+def export_metrics(path=None):
+    """ Write the current metrics to METRICS_PATH (or `path`), replacing the file atomically """
+    path = path or METRICS_PATH
+    if not path:
+        return
+    if path.endswith('.json'):
+        content = json.dumps(metrics.snapshot(), indent=2)
+    else:
+        content = metrics.to_prometheus()
+    # Collectors may read the file at any moment, so never expose a partly written one
+    with open(f"{path}.tmp", 'w') as metrics_file:
+        metrics_file.write(content)
+    os.replace(f"{path}.tmp", path)
+    logging.debug(f"Wrote metrics to {path}.")
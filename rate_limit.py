@@ -0,0 +1,184 @@
+# filename: rate_limit.py
+import os
+import re
+import time
+import logging
+import threading
+
+# Proactive request budgets per platform, in requests per second (0 disables the limit)
+PLATFORM_RATE_LIMITS = {
+    'insightcloudsec': float(os.getenv('INSIGHTCLOUDSEC_REQUESTS_PER_SECOND', '5')),
+    'insightvm': float(os.getenv('INSIGHTVM_REQUESTS_PER_SECOND', '5')),
+    'shodan': float(os.getenv('SHODAN_REQUESTS_PER_SECOND', '1')),
+    'cloudflare': float(os.getenv('CLOUDFLARE_REQUESTS_PER_SECOND', '5')),
+}
+# Requests that may be sent back to back before the steady rate applies
+RATE_LIMIT_BURST = float(os.getenv('RATE_LIMIT_BURST', '5'))
+
+# AIMD tuning for the per-endpoint controllers: multiplicative decrease on 429, additive probe-up
+ADAPTIVE_DECREASE_FACTOR = float(os.getenv('ADAPTIVE_DECREASE_FACTOR', '0.5'))
+ADAPTIVE_INCREASE_STEP = float(os.getenv('ADAPTIVE_INCREASE_STEP', '0.5'))
+ADAPTIVE_SUCCESS_STREAK = int(os.getenv('ADAPTIVE_SUCCESS_STREAK', '20'))
+ADAPTIVE_MIN_RATE = float(os.getenv('ADAPTIVE_MIN_RATE', '0.1'))
+# Ceiling for endpoints of a platform without a configured requests-per-second limit
+ADAPTIVE_MAX_RATE = float(os.getenv('ADAPTIVE_MAX_RATE', '20'))
+
+# Path segments that name a resource (site IDs, Shodan alert IDs) rather than an endpoint
+_ID_SEGMENT = re.compile(r'[0-9]+|[A-Z0-9]{10,}')
+
+
+class TokenBucket:
+    """ Thread-safe token bucket: `rate` tokens per second, holding at most `capacity` """
+
+    def __init__(self, rate, capacity=None):
+        self._lock = threading.Lock()
+        self.rate = rate
+        self.capacity = max(1.0, capacity if capacity is not None else RATE_LIMIT_BURST)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens=1):
+        """ Block until `tokens` are available and take them; returns the seconds waited """
+        if self.rate <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def set_rate(self, rate, drain=False):
+        """ Change the refill rate; `drain` also empties the bucket so no burst follows a slowdown """
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = rate
+            if drain:
+                self._tokens = 0.0
+
+
+class AdaptiveRateController:
+    """
+    An AIMD request rate for one endpoint, learned from the responses it gets.
+
+    A 429 multiplies the rate by ADAPTIVE_DECREASE_FACTOR and pauses the endpoint for every
+    worker until its Retry-After has passed. Each run of ADAPTIVE_SUCCESS_STREAK successes adds
+    ADAPTIVE_INCREASE_STEP requests per second, up to `ceiling`.
+    """
+
+    def __init__(self, key, ceiling, rate=None):
+        self.key = key
+        self.ceiling = ceiling
+        self._lock = threading.Lock()
+        self._streak = 0
+        self._paused_until = 0.0
+        self._bucket = TokenBucket(self._clamp(rate if rate is not None else ceiling))
+
+    def _clamp(self, rate):
+        return min(self.ceiling, max(ADAPTIVE_MIN_RATE, rate))
+
+    @property
+    def rate(self):
+        return self._bucket.rate
+
+    def set_rate(self, rate):
+        self._bucket.set_rate(self._clamp(rate))
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                pause = self._paused_until - time.monotonic()
+            if pause <= 0:
+                break
+            time.sleep(pause)
+        self._bucket.acquire()
+
+    def record_throttled(self, retry_after=None):
+        with self._lock:
+            self._streak = 0
+            if retry_after:
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            rate = self._clamp(self.rate * ADAPTIVE_DECREASE_FACTOR)
+            self._bucket.set_rate(rate, drain=True)
+        logging.info(f"{self.key} throttled; request rate lowered to {rate:.2f}/s.")
+
+    def record_success(self):
+        with self._lock:
+            self._streak += 1
+            if self._streak < ADAPTIVE_SUCCESS_STREAK or self.rate >= self.ceiling:
+                return
+            self._streak = 0
+            rate = self._clamp(self.rate + ADAPTIVE_INCREASE_STEP)
+            self._bucket.set_rate(rate)
+        logging.debug(f"{self.key} probing up to {rate:.2f}/s.")
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_rate_limiter(platform):
+    """ The token bucket shared by every worker that calls `platform` """
+    with _buckets_lock:
+        bucket = _buckets.get(platform)
+        if bucket is None:
+            bucket = _buckets[platform] = TokenBucket(PLATFORM_RATE_LIMITS.get(platform, 0))
+        return bucket
+
+
+_controllers = {}
+_learned_rates = {}
+_controllers_lock = threading.Lock()
+
+
+def endpoint_name(method, path):
+    """ An endpoint independent of the resource it addresses, e.g. 'DELETE /api/3/sites/{id}/included_targets' """
+    segments = path.split('/')
+    # The segment after 'api' is InsightVM's API version, not a resource
+    normalized = [
+        '{id}' if _ID_SEGMENT.fullmatch(segment) and (index == 0 or segments[index - 1] != 'api') else segment
+        for index, segment in enumerate(segments)
+    ]
+    return f"{method.upper()} {'/'.join(normalized)}"
+
+
+def endpoint_key(platform, method, path):
+    return f"{platform} {endpoint_name(method, path)}"
+
+
+def get_rate_controller(platform, method, path):
+    """ The adaptive controller shared by every worker calling this endpoint """
+    key = endpoint_key(platform, method, path)
+    with _controllers_lock:
+        controller = _controllers.get(key)
+        if controller is None:
+            ceiling = PLATFORM_RATE_LIMITS.get(platform) or ADAPTIVE_MAX_RATE
+            controller = _controllers[key] = AdaptiveRateController(key, ceiling, _learned_rates.get(key))
+        return controller
+
+
+def current_rates():
+    """ The current request rate of every endpoint used so far, plus learned rates not yet used """
+    with _controllers_lock:
+        rates = dict(_learned_rates)
+        rates.update({key: controller.rate for key, controller in _controllers.items()})
+        return rates
+
+
+def load_learned_rates(rates):
+    """ Seed endpoint controllers with rates persisted by a previous run """
+    with _controllers_lock:
+        _learned_rates.update(rates)
+        for key, rate in rates.items():
+            controller = _controllers.get(key)
+            if controller is not None:
+                controller.set_rate(rate)
@@ -1,45 +1,34 @@
 # filename: insightvm_remove_ips.py
 import requests
 import json
-import os
-import time
-import logging
-from requests.auth import HTTPBasicAuth
+from insightvm_batches import send_in_batches
+from http_client import get_client
+from audit_log import bounded
+from log_config import configure_logging
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+def remove_ips_from_insightvm_site(ips, site_id, batch_size=None, engine=None, on_success=None, on_outcome=None):
+    """ Remove an IPSet or iterable of IPs from a site, in concurrent chunks on `engine` if given; returns (or streams to `on_outcome`) one IPOutcome per collapsed target """
+    client = get_client('insightvm')
+    url = f"/api/3/sites/{site_id}/included_targets"
 
-# Disable warnings for SSL verification for this session
-requests.packages.urllib3.disable_warnings()
-
-def remove_ips_from_insightvm_site(ips, site_id):
-    session = requests.Session()
-    session.verify = False
-    username = os.getenv('INSIGHTVM_USERNAME')
-    password = os.getenv('INSIGHTVM_PASSWORD')
-    base_url = os.getenv('INSIGHTVM_BASE_URL')
-    url = f"{base_url}/api/3/sites/{site_id}/included_targets"
-    responses = []
-
-    for ip in ips:
+    def send_chunk(targets):
         try:
-            response = session.delete(url, auth=HTTPBasicAuth(username, password), json=[ip], headers={'Content-Type': 'application/json'})
-            if response.status_code == 429:
-                time.sleep(60)
-                response = session.delete(url, auth=HTTPBasicAuth(username, password), json=[ip], headers={'Content-Type': 'application/json'})
+            response = client.delete(url, json=targets)
             if response.status_code in [200, 201]:
-                responses.append({'ip': ip, 'status': 'success'})
-            else:
-                error_message = response.json().get('message', 'No error message provided')
-                responses.append({'ip': ip, 'status': 'error', 'message': error_message, 'http_status': response.status_code, 'response_content': response.text})
+                return response.status_code, None
+            error_message = response.json().get('message', 'No error message provided')
+            # The body is shared by every target of the chunk, so only a bounded excerpt is kept
+            return response.status_code, {'message': bounded(error_message), 'http_status': response.status_code, 'response_content': bounded(response.text)}
         except requests.exceptions.RequestException as e:
-            responses.append({'ip': ip, 'status': 'error', 'message': str(e)})
+            return None, {'message': str(e)}
 
-    return json.dumps(responses, indent=4)
+    # Remove the IPs as collapsed CIDRs/ranges, several targets per request
+    return send_in_batches(ips, send_chunk, batch_size, engine, f"insightvm:{site_id}", on_success, on_outcome)
 
 # Example function call
 if __name__ == "__main__":
+    configure_logging()
     ips_to_remove = ["8.8.8.8", "4.4.4.4", "1.1.1.1"]
     site_id = 201
     result = remove_ips_from_insightvm_site(ips_to_remove, site_id)
-    print(result)
+    print(json.dumps([outcome.to_dict() for outcome in result], indent=4))
@@ -0,0 +1,98 @@
+# filename: replace_ips_in_insightvm_site.py
+import os
+import requests
+import json
+import logging
+from insightvm_batches import collapse_targets, format_target, send_in_batches
+from http_client import get_client
+from get_insightvm_site_contents import get_site_targets
+from audit_log import bounded
+from results import IPOutcome, PlatformError
+from ip_set import IPSet, is_ip_entry
+from log_config import configure_logging
+
+# Most collapsed targets sent in the single PUT that replaces a site's included targets
+INSIGHTVM_REPLACE_MAX_TARGETS = int(os.getenv('INSIGHTVM_REPLACE_MAX_TARGETS', '10000'))
+
+def replace_ips_in_insightvm_site(ips, site_id, batch_size=None, replace_limit=None, engine=None, on_success=None, on_outcome=None):
+    """
+    Replace a site's included targets; returns one IPOutcome per collapsed target, or streams
+    each to `on_outcome` as it is known and returns an empty list.
+
+    On a WriteEngine the PUT holds the whole site exclusively, so no other write to it can
+    interleave, and the overflow POSTs are sent concurrently after it. `on_success(ip_set)` is
+    called for the replaced set and for each acknowledged overflow batch.
+    """
+    replace_limit = replace_limit or INSIGHTVM_REPLACE_MAX_TARGETS
+    endpoint = f"/api/3/sites/{site_id}/included_targets"
+    key = f"insightvm:{site_id}"
+
+    # Shared InsightVM session (basic auth, SSL validation disabled)
+    client = get_client('insightvm')
+
+    intervals = collapse_targets(ips)
+    replace_intervals, overflow_intervals = intervals[:replace_limit], intervals[replace_limit:]
+    targets = [format_target(interval) for interval in replace_intervals]
+
+    # Replace the whole target list in one request
+    def put_targets():
+        try:
+            # Hostnames and other entries an IPSet cannot hold are read back right before the PUT and
+            # kept, or the replace would delete them; the exclusive hold keeps the read current
+            kept = [entry for entry in get_site_targets(site_id) if not is_ip_entry(entry)]
+            if kept:
+                logging.debug(f"Keeping {len(kept)} non-IP targets of site {site_id} in the replace.")
+            response = client.put(endpoint, json=targets + kept)
+            if response.status_code in [200, 201]:
+                logging.debug(f"Replaced the included targets of site {site_id} with {len(targets)} targets.")
+                return None
+            return {'message': bounded(response.json().get('message', 'No error message provided')), 'http_status': response.status_code}
+        except PlatformError as e:
+            logging.error(f"Could not read the targets of site {site_id} before replacing them: {e}")
+            return {'message': str(e), 'http_status': e.status_code}
+        except requests.exceptions.RequestException as e:
+            logging.error(f"An error occurred while replacing the targets of site {site_id}: {e}")
+            return {'message': str(e)}
+
+    error_fields = put_targets() if engine is None else engine.submit(key, None, put_targets).result()
+    if error_fields is None and on_success is not None:
+        on_success(IPSet._from_merged(replace_intervals))
+
+    responses = []
+    report = responses.append if on_outcome is None else on_outcome
+    if not targets:
+        # Emptying a site has no per-target outcome, so the PUT itself is reported
+        target = f"site {site_id} (empty target list)"
+        report(IPOutcome(target, 'success', 0) if error_fields is None else IPOutcome(target, 'error', 0, **error_fields))
+    for target, (_, first, last) in zip(targets, replace_intervals):
+        if error_fields is None:
+            report(IPOutcome(target, 'success', last - first + 1))
+        else:
+            report(IPOutcome(target, 'error', last - first + 1, **error_fields))
+
+    # Anything beyond the PUT limit is appended with batched POSTs, but only onto a successful replace
+    if overflow_intervals:
+        overflow = [format_target(interval) for interval in overflow_intervals]
+        if error_fields is None:
+            def send_chunk(chunk):
+                try:
+                    response = client.post(endpoint, json=chunk)
+                    if response.status_code == 201:
+                        return response.status_code, None
+                    return response.status_code, {'message': bounded(response.json())}
+                except requests.exceptions.RequestException as e:
+                    return None, {'message': str(e)}
+            responses.extend(send_in_batches(overflow, send_chunk, batch_size, engine, key, on_success, on_outcome))
+        else:
+            for target, (_, first, last) in zip(overflow, overflow_intervals):
+                report(IPOutcome(target, 'error', last - first + 1, 'Not sent: site replace failed'))
+
+    return responses
+
+# Example function call
+if __name__ == "__main__":
+    configure_logging()
+    example_ips = ["8.8.8.8", "4.4.4.0/24"]
+    example_site_id = 201
+    result = replace_ips_in_insightvm_site(example_ips, example_site_id)
+    print(json.dumps([outcome.to_dict() for outcome in result], indent=2))
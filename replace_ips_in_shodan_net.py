@@ -1,72 +1,69 @@
 # filename: replace_ips_in_shodan_net.py
 
-import os
 import requests
 import json
-import time
 import logging
+from ip_set import IPSet
+from http_client import get_client, platform_error
+from results import NotFoundError
+from shodan_alerts import get_alert_catalogue
+from log_config import configure_logging
 
-# Set up logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-
-# Environment variables
-SHODAN_BASE_URL = os.getenv('SHODAN_BASE_URL')
-SHODAN_API_KEY = os.getenv('SHODAN_API_KEY')
-
-# Function to replace IPs in Shodan network
+# Function to replace IPs in Shodan network; ip_list may be an IPSet or any iterable of IPs, CIDRs and ranges.
+# Returns the updated alert, and raises NotFoundError or PlatformError on failure.
 def replace_ips_in_shodan_net(ip_list, network_name):
-    # creating Session object and declaring the verify variable to False
-    session = requests.Session()
-    session.verify = False
+    ip_set = ip_list if isinstance(ip_list, IPSet) else IPSet(ip_list)
+
+    # Shared Shodan session (API key as query parameter, SSL validation disabled)
+    client = get_client('shodan')
+    catalogue = get_alert_catalogue()
 
-    # Retrieve the alert ID associated with the network name
+    # Retrieve the alert ID associated with the network name from the cached catalogue
     try:
-        response = session.get(f"{SHODAN_BASE_URL}/shodan/alert/info?key={SHODAN_API_KEY}")
-        response.raise_for_status()
-        alerts = response.json()
-        alert_id = None
-        for alert in alerts:
-            if alert.get('name') == network_name:
-                alert_id = alert.get('id')
-                break
-        if not alert_id:
+        alert = catalogue.get_by_name(network_name)
+        if not alert or not alert.get('id'):
             logging.error(f"No alert found with the name: {network_name}")
-            return None
+            raise NotFoundError('shodan', f"No alert found with the name: {network_name}")
+        alert_id = alert['id']
+        current_ips = IPSet(alert.get('filters', {}).get('ip', []))
 
         logging.debug(f"Retrieved alert ID for network: {network_name}")
 
     except requests.exceptions.RequestException as e:
         logging.error(f"Error retrieving alert ID: {e}")
-        return None
+        raise platform_error('shodan', e) from e
+
+    # Compare as merged intervals, so equivalent CIDR/range spellings do not trigger a write
+    if current_ips == ip_set:
+        logging.debug(f"Network {network_name} already matches, skipping the update.")
+        return alert
 
-    # Prepare the payload
+    # Prepare the payload with the minimal CIDR cover of the set
     payload = {
         "filters": {
-            "ip": ip_list,
+            "ip": [str(network) for network in ip_set.cidrs()],
         }
     }
 
-    # Make the API call to replace IPs
+    # Make the API call to replace IPs; Retry-After on 429 is honored by the shared client
     try:
-        response = session.post(f"{SHODAN_BASE_URL}/shodan/alert/{alert_id}?key={SHODAN_API_KEY}",
-                                headers={'Content-Type': 'application/json'},
-                                data=json.dumps(payload))
-        if response.status_code == 429:
-            # Handle rate limiting with exponential backoff
-            retry_after = int(response.headers.get('Retry-After', 60))
-            logging.warning(f"Rate limit exceeded. Retrying after {retry_after} seconds.")
-            time.sleep(retry_after)
-            return replace_ips_in_shodan_net(ip_list, network_name)
+        response = client.post(f"/shodan/alert/{alert_id}",
+                               headers={'Content-Type': 'application/json'},
+                               data=json.dumps(payload))
         response.raise_for_status()
         logging.debug(f"IPs successfully replaced in the network: {network_name}")
-        return response.json()
+        result = response.json()
+        # Keep the cached alert current so later reads see the new filters without a refetch
+        catalogue.update(result if isinstance(result, dict) and result.get('id') else {**alert, 'filters': payload['filters']})
+        return result
     except requests.exceptions.RequestException as e:
         logging.error(f"Error replacing IPs in Shodan network: {e}")
-        return None
+        raise platform_error('shodan', e) from e
 
 # Example function call
 if __name__ == "__main__":
+    configure_logging()
     example_ips = ["8.8.8.8", "4.4.4.4"]
     network_name = "Cloud Public IPs (Cloudflare)"
     result = replace_ips_in_shodan_net(example_ips, network_name)
-    print(result)
\ No newline at end of file
+    print(json.dumps(result, indent=4))
\ No newline at end of file
@@ -0,0 +1,57 @@
+# filename: results.py
+from dataclasses import dataclass, asdict
+from typing import Any, Optional
+from ip_set import IPSet
+
+
+class SyncError(Exception):
+    """ Base class for errors raised by the sync API """
+
+
+class PlatformError(SyncError):
+    """ A platform API call failed after retries """
+
+    def __init__(self, platform, message, status_code=None):
+        self.platform = platform
+        self.status_code = status_code
+        super().__init__(f"{platform}: {message}" + (f" (HTTP {status_code})" if status_code else ""))
+
+
+class NotFoundError(PlatformError):
+    """ A named site or alert does not exist on the platform """
+
+
+@dataclass(slots=True)
+class IPOutcome:
+    """ The result of writing one collapsed target (single IP, CIDR or range) to a platform """
+    ip: str
+    status: str
+    count: int = 1
+    message: Any = None
+    http_status: Optional[int] = None
+    response_content: Optional[str] = None
+
+    @property
+    def ok(self):
+        return self.status == 'success'
+
+    def to_dict(self):
+        """ JSON-ready form for the CLI and audit boundary; unset fields are omitted """
+        return {key: value for key, value in asdict(self).items() if value is not None}
+
+
+@dataclass(slots=True)
+class TargetChange:
+    """ The diff computed for one sync target """
+    key: str
+    target: dict
+    source_ips: IPSet
+    target_ips: IPSet
+    additions: Optional[IPSet] = None
+    removals: Optional[IPSet] = None
+    # How an InsightVM change is applied ('incremental' or 'replace'), once decided
+    strategy: Optional[str] = None
+
+    @property
+    def is_empty(self):
+        return not self.additions and not self.removals
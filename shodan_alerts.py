@@ -0,0 +1,96 @@
+# filename: shodan_alerts.py
+import os
+import time
+import logging
+import threading
+import requests
+from http_client import get_client
+from json_stream import iter_response_items
+
+# Seconds the alert catalogue is reused before /shodan/alert/info is fetched again
+SHODAN_ALERT_CACHE_TTL = float(os.getenv('SHODAN_ALERT_CACHE_TTL', '300'))
+
+
+def project_alert(alert):
+    """ The parts of an alert the sync reads and writes: its ID, name and IP filters """
+    filters = alert.get('filters')
+    return {
+        'id': alert.get('id'),
+        'name': alert.get('name'),
+        'filters': {'ip': filters.get('ip', [])} if isinstance(filters, dict) else {},
+    }
+
+
+class AlertCatalogue:
+    """
+    The Shodan alert list, fetched once per TTL and indexed by name and ID.
+
+    Concurrent lookups share a single fetch. The catalogue is parsed one alert at a time as it
+    streams in and only each alert's ID, name and IP filters are kept. A successful replace
+    updates the cached alert in place, so the next read of that alert does not need another
+    catalogue download.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = SHODAN_ALERT_CACHE_TTL if ttl is None else ttl
+        self._lock = threading.Lock()
+        self._by_name = {}
+        self._by_id = {}
+        self._fetched_at = None
+
+    def _refresh_if_stale(self):
+        with self._lock:
+            if self._fetched_at is not None and time.monotonic() - self._fetched_at < self.ttl:
+                return
+            # Rate limiting is retried by the shared client; other HTTP errors propagate to the caller
+            response = get_client('shodan').get("/shodan/alert/info", stream=True)
+            by_name = {}
+            by_id = {}
+            with response:
+                response.raise_for_status()
+                try:
+                    for alert in iter_response_items(response):
+                        alert = project_alert(alert)
+                        # The first alert wins when several share a name, as in a linear scan
+                        by_name.setdefault(alert['name'], alert)
+                        by_id[alert['id']] = alert
+                except (ValueError, AttributeError) as e:
+                    raise requests.exceptions.InvalidJSONError(f"Malformed alert catalogue: {e}", response=response) from e
+            self._by_name, self._by_id = by_name, by_id
+            self._fetched_at = time.monotonic()
+            logging.debug(f"Cached {len(by_id)} Shodan alerts.")
+
+    def get_by_name(self, name):
+        self._refresh_if_stale()
+        return self._by_name.get(name)
+
+    def get_by_id(self, alert_id):
+        self._refresh_if_stale()
+        return self._by_id.get(alert_id)
+
+    def update(self, alert):
+        """ Store an alert returned by a successful write in place of the cached copy """
+        with self._lock:
+            if not isinstance(alert, dict) or alert.get('id') not in self._by_id:
+                self._fetched_at = None
+                return
+            previous = self._by_id[alert['id']]
+            # Only the fields the write returned replace the cached ones
+            projected = project_alert(alert)
+            merged = {**previous, **{key: projected[key] for key in projected if key in alert}}
+            self._by_id[alert['id']] = merged
+            if self._by_name.get(previous.get('name')) is previous:
+                del self._by_name[previous.get('name')]
+            self._by_name.setdefault(merged.get('name'), merged)
+
+    def invalidate(self):
+        with self._lock:
+            self._fetched_at = None
+
+
+_catalogue = AlertCatalogue()
+
+
+def get_alert_catalogue():
+    """ The process-wide alert catalogue shared by the Shodan reader and writer """
+    return _catalogue
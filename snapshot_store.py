@@ -0,0 +1,144 @@
+# filename: snapshot_store.py
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import namedtuple
+from ip_set import IPSet
+
+# Location of the local state database and how long a set the tool wrote itself is trusted
+SNAPSHOT_DB_PATH = os.getenv('SNAPSHOT_DB_PATH', 'ip_sync_state.db')
+SNAPSHOT_TTL = float(os.getenv('SNAPSHOT_TTL', '900'))
+
+Snapshot = namedtuple('Snapshot', ['key', 'ip_set', 'digest', 'fetched_at', 'written_digest', 'written_at'])
+
+
+class SnapshotStore:
+    """
+    Last-known IP set per source/target, keyed by strings such as 'insightcloudsec' or
+    'insightvm:200', stored in SQLite with timestamps and content digests, alongside the
+    request rates learned per API endpoint and the batches acknowledged under a change plan.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or SNAPSHOT_DB_PATH
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS snapshots ("
+                " key TEXT PRIMARY KEY,"
+                " ranges TEXT NOT NULL,"
+                " digest TEXT NOT NULL,"
+                " fetched_at REAL,"
+                " written_digest TEXT,"
+                " written_at REAL)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limits ("
+                " endpoint TEXT PRIMARY KEY,"
+                " rate REAL NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS apply_progress ("
+                " plan_digest TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " action TEXT NOT NULL,"
+                " ranges TEXT NOT NULL)"
+            )
+
+    def get(self, key):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT key, ranges, digest, fetched_at, written_digest, written_at FROM snapshots WHERE key = ?",
+                (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return Snapshot(row[0], IPSet(json.loads(row[1])), row[2], row[3], row[4], row[5])
+
+    def record_fetch(self, key, ip_set):
+        """ Store a freshly fetched set and return the previous snapshot (or None) """
+        previous = self.get(key)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO snapshots (key, ranges, digest, fetched_at) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT(key) DO UPDATE SET ranges = excluded.ranges, digest = excluded.digest,"
+                " fetched_at = excluded.fetched_at",
+                (key, json.dumps(ip_set.to_strings()), ip_set.digest(), time.time())
+            )
+        return previous
+
+    def record_write(self, key, ip_set):
+        """ Store the set the tool just wrote to a target, so the next run can trust it within the TTL """
+        digest = ip_set.digest()
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO snapshots (key, ranges, digest, fetched_at, written_digest, written_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(key) DO UPDATE SET ranges = excluded.ranges, digest = excluded.digest,"
+                " written_digest = excluded.written_digest, written_at = excluded.written_at",
+                (key, json.dumps(ip_set.to_strings()), digest, None, digest, now)
+            )
+
+    def trusted_target(self, key, ttl=None):
+        """
+        Return the stored set for a target the tool wrote within `ttl` seconds, provided no fetch
+        since then has observed different contents; otherwise None, meaning it must be refetched.
+        """
+        ttl = SNAPSHOT_TTL if ttl is None else ttl
+        snapshot = self.get(key)
+        if snapshot is None or snapshot.written_at is None or ttl <= 0:
+            return None
+        if snapshot.digest != snapshot.written_digest or time.time() - snapshot.written_at > ttl:
+            return None
+        logging.debug(f"Using snapshot for {key}, written {time.time() - snapshot.written_at:.0f}s ago.")
+        return snapshot.ip_set
+
+    def get_rates(self):
+        """ Request rates learned per endpoint by earlier runs """
+        with self._lock:
+            rows = self._connection.execute("SELECT endpoint, rate FROM rate_limits").fetchall()
+        return dict(rows)
+
+    def record_rates(self, rates):
+        """ Persist learned request rates so the next run starts near the sustainable throughput """
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT INTO rate_limits (endpoint, rate, updated_at) VALUES (?, ?, ?)"
+                " ON CONFLICT(endpoint) DO UPDATE SET rate = excluded.rate, updated_at = excluded.updated_at",
+                [(endpoint, rate, now) for endpoint, rate in rates.items()]
+            )
+
+    def record_progress(self, plan_digest, key, action, ip_set):
+        """ Checkpoint one acknowledged write batch of a change plan """
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO apply_progress (plan_digest, key, action, ranges) VALUES (?, ?, ?, ?)",
+                (plan_digest, key, action, json.dumps(ip_set.to_strings()))
+            )
+
+    def get_progress(self, plan_digest):
+        """ Everything already written under a change plan, as {(key, action): IPSet} """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT key, action, ranges FROM apply_progress WHERE plan_digest = ?", (plan_digest,)
+            ).fetchall()
+        entries = {}
+        for key, action, ranges in rows:
+            entries.setdefault((key, action), []).extend(json.loads(ranges))
+        return {step: IPSet(ranges) for step, ranges in entries.items()}
+
+    def clear_progress(self, plan_digests):
+        """ Drop the checkpoints written under the given change plan entries """
+        with self._lock, self._connection:
+            self._connection.executemany("DELETE FROM apply_progress WHERE plan_digest = ?", [(digest,) for digest in plan_digests])
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
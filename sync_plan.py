@@ -0,0 +1,129 @@
+# filename: sync_plan.py
+import os
+import json
+import logging
+from metadata_index import ROUTING_FIELDS
+from results import SyncError
+
+# Path of the JSON sync plan; when it does not exist the plan is built from environment variables
+SYNC_PLAN_PATH = os.getenv('SYNC_PLAN_PATH', 'sync_plan.json')
+SYNC_MAX_WORKERS = int(os.getenv('SYNC_MAX_WORKERS', '4'))
+# Seconds between daemon sync cycles for pairs that do not set their own 'interval'
+SYNC_INTERVAL = float(os.getenv('SYNC_INTERVAL', '3600'))
+
+SOURCE_TYPES = {'insightcloudsec', 'cloudflare'}
+# Source types whose inventory carries metadata that pairs can route on with 'where'
+ROUTABLE_SOURCE_TYPES = {'insightcloudsec'}
+TARGET_TYPES = {'insightvm': 'site_id', 'shodan': 'alert'}
+
+
+class SyncPlanError(SyncError, ValueError):
+    """ Raised for a sync plan that is missing fields or references unknown sources """
+
+
+def target_key(target):
+    """ Stable identifier of a target, also used as its snapshot key, e.g. 'insightvm:200' """
+    return f"{target['type']}:{target[TARGET_TYPES[target['type']]]}"
+
+
+def describe_target(target):
+    if target['type'] == 'insightvm':
+        return f"InsightVM Site {target['site_id']}"
+    return f"Shodan Alert {target['alert']}"
+
+
+def _expand(value):
+    """ Substitute ${VAR} references in string settings with environment variables """
+    if isinstance(value, str):
+        return os.path.expandvars(value)
+    if isinstance(value, dict):
+        return {key: _expand(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_expand(item) for item in value]
+    return value
+
+
+def default_sync_plan(site_id=None):
+    """ The plan used without a config file: the Azure/AWS InsightVM site fed from InsightCloudSec """
+    site_id = site_id or os.getenv('INSIGHTVM_AZURE_AWS_SITE_ID')
+    return {
+        'max_workers': SYNC_MAX_WORKERS,
+        'sources': {'insightcloudsec': {'type': 'insightcloudsec'}},
+        'pairs': [{'source': 'insightcloudsec', 'target': {'type': 'insightvm', 'site_id': site_id}}],
+    }
+
+
+def validate_sync_plan(plan):
+    sources = plan.get('sources') or {}
+    pairs = plan.get('pairs') or []
+    if not pairs:
+        raise SyncPlanError("Sync plan has no pairs.")
+    for name, source in sources.items():
+        if source.get('type') not in SOURCE_TYPES:
+            raise SyncPlanError(f"Source '{name}' has unknown type {source.get('type')!r}.")
+    for index, pair in enumerate(pairs):
+        if pair.get('source') not in sources:
+            raise SyncPlanError(f"Pair {index} references unknown source {pair.get('source')!r}.")
+        where = pair.get('where')
+        if where:
+            if sources[pair['source']]['type'] not in ROUTABLE_SOURCE_TYPES:
+                raise SyncPlanError(f"Pair {index} routes on metadata, which source '{pair['source']}' does not have.")
+            unknown = set(where) - ROUTING_FIELDS
+            if unknown:
+                raise SyncPlanError(f"Pair {index} routes on unknown fields: {', '.join(sorted(unknown))}.")
+        interval = pair.get('interval', SYNC_INTERVAL)
+        if isinstance(interval, bool) or not isinstance(interval, (int, float)) or interval <= 0:
+            raise SyncPlanError(f"Pair {index} has an invalid interval {interval!r}; expected a positive number of seconds.")
+        pair['interval'] = interval
+        target = pair.get('target') or {}
+        field = TARGET_TYPES.get(target.get('type'))
+        if field is None:
+            raise SyncPlanError(f"Pair {index} has unknown target type {target.get('type')!r}.")
+        value = target.get(field)
+        if value in (None, '') or (isinstance(value, str) and '$' in value):
+            raise SyncPlanError(f"Pair {index} target is missing '{field}' (is its environment variable set?).")
+        target[field] = str(value)
+    plan['max_workers'] = max(1, int(plan.get('max_workers', SYNC_MAX_WORKERS)))
+    return plan
+
+
+def load_sync_plan(path=None, default_site_id=None):
+    path = path or SYNC_PLAN_PATH
+    if os.path.exists(path):
+        with open(path) as plan_file:
+            plan = _expand(json.load(plan_file))
+        logging.debug(f"Loaded sync plan from {path}.")
+    else:
+        plan = default_sync_plan(default_site_id)
+        logging.debug(f"No sync plan at {path}, using the environment defaults.")
+    return validate_sync_plan(plan)
+
+
+def group_targets(plan):
+    """
+    Group pairs by target, so every target is fetched and written once even when several sources
+    feed it. Returns {target_key: {'target': target, 'sources': [{'source': name, 'where': rule}]}}
+    in plan order; 'where' is the pair's metadata routing rule, or None for the whole source.
+    """
+    targets = {}
+    for pair in plan['pairs']:
+        key = target_key(pair['target'])
+        entry = targets.setdefault(key, {'target': pair['target'], 'sources': []})
+        selection = {'source': pair['source'], 'where': pair.get('where') or None}
+        if selection not in entry['sources']:
+            entry['sources'].append(selection)
+    return targets
+
+
+def target_intervals(plan):
+    """ Seconds between sync cycles per target key: the shortest interval among the pairs feeding it """
+    intervals = {}
+    for pair in plan['pairs']:
+        key = target_key(pair['target'])
+        intervals[key] = min(intervals.get(key, pair['interval']), pair['interval'])
+    return intervals
+
+
+def select_targets(plan, keys):
+    """ A copy of the plan restricted to the pairs that feed the given target keys """
+    return {**plan, 'pairs': [pair for pair in plan['pairs'] if target_key(pair['target']) in keys]}
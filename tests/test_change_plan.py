@@ -0,0 +1,70 @@
+import os
+from unittest import mock
+
+import change_plan
+from change_plan import ApplyCheckpoint, load_change_plan, prepare_changes
+from ip_set import IPSet
+from results import TargetChange
+from snapshot_store import SnapshotStore
+from sync_plan import select_targets, validate_sync_plan
+
+SOURCE = IPSet(['10.0.0.0/24'])
+
+
+def sync_plan():
+    return validate_sync_plan({
+        'sources': {'inventory': {'type': 'cloudflare'}},
+        'pairs': [
+            {'source': 'inventory', 'target': {'type': 'insightvm', 'site_id': '1'}},
+            {'source': 'inventory', 'target': {'type': 'insightvm', 'site_id': '2'}},
+        ],
+    })
+
+
+def fake_calculate(plan, store, sources):
+    return [
+        TargetChange(f"insightvm:{pair['target']['site_id']}", pair['target'], SOURCE, IPSet(), additions=SOURCE)
+        for pair in plan['pairs']
+    ]
+
+
+def test_cycles_for_other_targets_keep_unfinished_entries(tmp_path):
+    path = os.path.join(tmp_path, 'change_plan.json')
+    store = SnapshotStore(os.path.join(tmp_path, 'state.db'))
+    plan = sync_plan()
+    with mock.patch.object(change_plan, 'calculate_changes', side_effect=fake_calculate) as calculate, \
+            mock.patch.object(change_plan, 'fetch_sources', return_value={'inventory': SOURCE}) as fetch:
+        first, _ = prepare_changes(select_targets(plan, ['insightvm:1']), store, path)
+        digest = first['targets']['insightvm:1']['digest']
+        ApplyCheckpoint(store, {'insightvm:1': digest}).recorder('insightvm:1', 'Addition')(IPSet(['10.0.0.0/25']))
+
+        # A cycle for the other target neither refetches sources nor touches the first entry
+        prepare_changes(select_targets(plan, ['insightvm:2']), store, path)
+        fetch.assert_not_called()
+        assert load_change_plan(path)['targets']['insightvm:1']['digest'] == digest
+        assert ApplyCheckpoint(store, {'insightvm:1': digest}).done('insightvm:1', 'Addition') == IPSet(['10.0.0.0/25'])
+
+        # The first target's next cycle resumes its entry instead of diffing again
+        calculate.reset_mock()
+        _, changes = prepare_changes(select_targets(plan, ['insightvm:1']), store, path)
+        calculate.assert_not_called()
+        assert [change.key for change in changes] == ['insightvm:1']
+    store.close()
+
+
+def test_expired_entry_is_replaced_with_its_checkpoints(tmp_path):
+    path = os.path.join(tmp_path, 'change_plan.json')
+    store = SnapshotStore(os.path.join(tmp_path, 'state.db'))
+    plan = select_targets(sync_plan(), ['insightvm:1'])
+    with mock.patch.object(change_plan, 'calculate_changes', side_effect=fake_calculate) as calculate, \
+            mock.patch.object(change_plan, 'fetch_sources', return_value={'inventory': SOURCE}):
+        first, _ = prepare_changes(plan, store, path)
+        digest = first['targets']['insightvm:1']['digest']
+        ApplyCheckpoint(store, {'insightvm:1': digest}).recorder('insightvm:1', 'Addition')(SOURCE)
+
+        # Older than the target's interval plus CHANGE_PLAN_MAX_AGE
+        with mock.patch.object(change_plan.time, 'time', return_value=first['targets']['insightvm:1']['created_at'] + 10 ** 6):
+            prepare_changes(plan, store, path)
+        assert calculate.call_count == 2
+        assert not ApplyCheckpoint(store, {'insightvm:1': digest}).acknowledged('insightvm:1', 'Addition')
+    store.close()
@@ -0,0 +1,27 @@
+from change_planner import INCREMENTAL, REPLACE, plan_insightvm_change
+from ip_set import IPSet
+from results import TargetChange
+
+
+def change(source, target):
+    source_ips, target_ips = IPSet(source), IPSet(target)
+    return TargetChange('insightvm:1', {'type': 'insightvm', 'site_id': '1'}, source_ips, target_ips,
+                        additions=(source_ips - target_ips) or None, removals=(target_ips - source_ips) or None)
+
+
+def test_savings_reported_for_either_strategy():
+    sites = [f"10.{i // 200}.{i % 200}.1" for i in range(1200)]
+    incremental = plan_insightvm_change(change(sites + ['192.0.2.1'], sites), batch_size=500, replace_limit=100)
+    assert incremental['strategy'] == INCREMENTAL
+    assert incremental['savings'] == incremental['replace_requests'] - incremental['incremental_requests'] > 0
+
+    replace = plan_insightvm_change(change([], sites), batch_size=500)
+    assert replace['strategy'] == REPLACE
+    assert replace['savings'] == replace['incremental_requests'] - replace['replace_requests'] == 1
+
+
+def test_small_diff_on_large_site_stays_incremental():
+    sites = [f"10.{i // 250}.{i % 250}.1" for i in range(5000)]
+    decision = plan_insightvm_change(change(sites[1:] + ['192.0.2.1'], sites), batch_size=500)
+    assert decision['strategy'] == INCREMENTAL
+    assert (decision['incremental_requests'], decision['replace_requests']) == (2, 11)
@@ -0,0 +1,35 @@
+import time
+
+import pytest
+
+from fetch_stage import FetchError, run_fetch_stage
+
+
+def sleeper(seconds, value=None):
+    def fetch():
+        time.sleep(seconds)
+        return value
+    return fetch
+
+
+def test_queued_fetch_gets_its_own_timeout():
+    # 'queued' waits ~0.3s for the single worker, then needs 0.2s of its own 0.4s budget
+    results = run_fetch_stage({'slow': sleeper(0.3, 1), 'queued': sleeper(0.2, 2)}, timeout=0.4, max_workers=1)
+    assert results == {'slow': 1, 'queued': 2}
+
+
+def test_stalled_fetch_times_out_from_its_start():
+    started = time.monotonic()
+    with pytest.raises(FetchError) as raised:
+        run_fetch_stage({'ok': sleeper(0.05, 1), 'stalled': sleeper(5)}, timeout=0.3, max_workers=1)
+    assert list(raised.value.errors) == ['stalled']
+    assert isinstance(raised.value.errors['stalled'], TimeoutError)
+    assert time.monotonic() - started < 1
+
+
+def test_errors_are_collected():
+    def broken():
+        raise ValueError('boom')
+    with pytest.raises(FetchError) as raised:
+        run_fetch_stage({'broken': broken, 'ok': sleeper(0, 1)})
+    assert list(raised.value.errors) == ['broken']
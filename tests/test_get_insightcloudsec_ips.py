@@ -0,0 +1,67 @@
+import json
+from unittest import mock
+
+import pytest
+
+import get_insightcloudsec_ips
+from get_insightcloudsec_ips import iter_insightcloudsec_ips
+from results import PlatformError
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.body = json.dumps(payload).encode()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        return (self.body[i:i + chunk_size] for i in range(0, len(self.body), chunk_size))
+
+
+class FakeClient:
+    """ A resource query endpoint that caps pages at `cap` and may drop resources """
+
+    def __init__(self, size, cap, report_total=True, lost=0):
+        self.addresses = [f"10.0.{i // 256}.{i % 256}" for i in range(size - lost)]
+        self.size = size
+        self.cap = cap
+        self.report_total = report_total
+
+    def post(self, path, json=None, stream=False):
+        offset, limit = json['offset'], min(json['limit'], self.cap)
+        payload = {'resources': [
+            {'publicip': {'common': {'resource_name': address, 'cloud': 'AWS', 'unused': 'x' * 50}}}
+            for address in self.addresses[offset:offset + limit]
+        ]}
+        if self.report_total:
+            payload['counts'] = {'publicip': self.size}
+        return FakeResponse(payload)
+
+
+def fetch(client, page_size):
+    with mock.patch.object(get_insightcloudsec_ips, 'get_client', return_value=client):
+        return list(iter_insightcloudsec_ips(page_size=page_size, max_workers=2))
+
+
+@pytest.mark.parametrize('report_total', [True, False])
+def test_pages_step_by_the_server_cap(report_total):
+    entries = fetch(FakeClient(3500, cap=1000, report_total=report_total), page_size=2000)
+    assert sorted(entry['IP Address'] for entry in entries) == sorted(FakeClient(3500, 1000).addresses)
+    assert entries[0]['Metadata'] == {'resource_name': entries[0]['IP Address'], 'cloud': 'AWS'}
+
+
+def test_missing_resources_raise():
+    with pytest.raises(PlatformError, match='Received 3490 resources but the query reported 3500'):
+        fetch(FakeClient(3500, cap=1000, lost=10), page_size=1000)
+
+
+def test_empty_first_page_with_total_raises():
+    with pytest.raises(PlatformError):
+        fetch(FakeClient(100, cap=0), page_size=1000)
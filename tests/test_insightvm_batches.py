@@ -0,0 +1,19 @@
+from insightvm_batches import send_in_batches
+
+
+def test_bisection_stops_at_one_collapsed_target():
+    sent = []
+
+    def send_chunk(targets):
+        sent.append(targets)
+        if '10.1.0.0/16' in targets:
+            return 422, {'message': 'rejected'}
+        return 201, None
+
+    outcomes = send_in_batches(['10.1.0.0/16', '192.0.2.1', '192.0.2.10'], send_chunk, batch_size=10)
+
+    assert len(sent) == 3
+    assert {outcome.ip: outcome.status for outcome in outcomes} == {
+        '10.1.0.0/16': 'error', '192.0.2.1': 'success', '192.0.2.10': 'success',
+    }
+    assert next(outcome for outcome in outcomes if not outcome.ok).count == 65536
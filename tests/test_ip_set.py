@@ -0,0 +1,82 @@
+import random
+from ipaddress import IPv4Address
+
+import pytest
+
+from ip_set import IPSet
+
+
+def addresses(ip_set):
+    return set(ip_set)
+
+
+def test_adjacent_and_overlapping_entries_merge():
+    ip_set = IPSet(['10.0.0.0/25', '10.0.0.128/25', '10.0.1.0-10.0.1.10', '10.0.1.5-10.0.1.20', '10.0.1.21'])
+    assert ip_set.to_strings() == ['10.0.0.0-10.0.1.21']
+    assert ip_set.num_ranges == 1
+    assert ip_set.num_addresses == 256 + 22
+
+
+def test_v4_and_v6_intervals_in_one_set():
+    ip_set = IPSet(['2001:db8::1', '10.0.0.1', '2001:db8::2', '0.0.0.0', '::'])
+    # IPv4 0.0.0.0 and IPv6 :: share the integer 0 but must never merge
+    assert ip_set.to_strings() == ['0.0.0.0', '10.0.0.1', '::', '2001:db8::1-2001:db8::2']
+    assert '2001:db8::2' in ip_set
+    assert '::1' not in ip_set
+    assert (ip_set - IPSet(['0.0.0.0/0'])).to_strings() == ['::', '2001:db8::1-2001:db8::2']
+    assert (ip_set & IPSet(['::/0'])).num_addresses == 3
+
+
+def test_difference_punches_holes_in_a_range():
+    ip_set = IPSet(['10.0.0.0/24']) - IPSet(['10.0.0.10', '10.0.0.20-10.0.0.29', '10.0.0.255'])
+    assert ip_set.to_strings() == ['10.0.0.0-10.0.0.9', '10.0.0.11-10.0.0.19', '10.0.0.30-10.0.0.254']
+    assert ip_set.num_addresses == 256 - 12
+    assert '10.0.0.10' not in ip_set and '10.0.0.11' in ip_set
+    assert '10.0.0.30-10.0.0.40' in ip_set
+    assert '10.0.0.5-10.0.0.15' not in ip_set
+
+
+def test_ranges_with_spaces_and_integer_addresses():
+    spaced = IPSet(['10.0.0.1 - 10.0.0.4', ' 10.0.0.9 '])
+    assert spaced == IPSet(['10.0.0.1-10.0.0.4', '10.0.0.9'])
+    assert IPSet([str(int(IPv4Address('192.0.2.7')))]).to_strings() == ['192.0.2.7']
+    assert IPSet([f"{int(IPv4Address('192.0.2.1'))} - {int(IPv4Address('192.0.2.3'))}"]).to_strings() == ['192.0.2.1-192.0.2.3']
+    # Reversed bounds are accepted as the same range
+    assert IPSet(['10.0.0.4 - 10.0.0.1']) == spaced - IPSet(['10.0.0.9'])
+
+
+def test_invalid_entries_are_dropped():
+    assert IPSet(['scanner.example.com', '10.0.0.1', '10.0.0.1-2001:db8::1']).to_strings() == ['10.0.0.1']
+    assert 'not-an-ip' not in IPSet(['10.0.0.0/8'])
+
+
+@pytest.mark.parametrize('entries', [
+    ['10.0.0.0/24', '10.0.1.0-10.0.1.77', '192.0.2.1'],
+    ['2001:db8::/126', '2001:db8::10-2001:db8::1f', '10.0.0.3-10.0.0.200'],
+])
+def test_cidrs_and_strings_round_trip(entries):
+    ip_set = IPSet(entries)
+    assert IPSet(str(network) for network in ip_set.cidrs()) == ip_set
+    assert IPSet(ip_set.to_strings()) == ip_set
+    assert addresses(IPSet(addresses(ip_set))) == addresses(ip_set)
+
+
+def test_set_algebra_matches_python_sets():
+    rng = random.Random(0)
+
+    def random_set():
+        entries = []
+        for _ in range(rng.randint(0, 12)):
+            first = rng.randint(0, 300)
+            last = first + rng.randint(0, 20)
+            entries.append(f"10.0.{first // 256}.{first % 256}-10.0.{last // 256}.{last % 256}")
+        return IPSet(entries)
+
+    for _ in range(200):
+        a, b = random_set(), random_set()
+        assert addresses(a | b) == addresses(a) | addresses(b)
+        assert addresses(a - b) == addresses(a) - addresses(b)
+        assert addresses(a & b) == addresses(a) & addresses(b)
+        assert (a | b).num_addresses == len(addresses(a) | addresses(b))
+        probe = f"10.0.{rng.randint(0, 1)}.{rng.randint(0, 255)}"
+        assert (probe in a) == (probe in addresses(a))
@@ -0,0 +1,45 @@
+import json
+
+import pytest
+
+from json_stream import iter_array, iter_object_array
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize('chunks, expected', [
+    ([b'[1.', b'5]'], [1.5]),
+    ([b'[1e', b'5]'], [1e5]),
+    ([b'[1e-', b'5]'], [1e-5]),
+    ([b'[1E+', b'2, 3]'], [1e2, 3]),
+    ([b'[-', b'12.5', b'e1]'], [-125.0]),
+    ([b'[12', b'34]'], [1234]),
+    ([b'[tr', b'ue, nu', b'll]'], [True, None]),
+    ([b'["\xc3', b'\xa9"]'], ['é']),
+])
+def test_values_split_across_chunks(chunks, expected):
+    assert list(iter_array(chunks)) == expected
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 64])
+def test_every_chunk_boundary(size):
+    document = {
+        'counts': {'publicip': 3},
+        'resources': [{'id': i, 'score': -1.25e-3 * i, 'name': 'é "x"', 'tags': [None, True]} for i in range(20)],
+        'total': 12345,
+    }
+    fields = {}
+    items = list(iter_object_array(chunked(json.dumps(document, ensure_ascii=False).encode(), size), 'resources', fields))
+    assert items == document['resources']
+    assert fields == {'counts': {'publicip': 3}, 'total': 12345}
+
+
+@pytest.mark.parametrize('chunks', [[b'[1.'], [b'[1', b'e'], [b'[1 2]'], [b'{"resources": [1, 2']])
+def test_malformed_input_raises(chunks):
+    with pytest.raises(ValueError):
+        if chunks[0].startswith(b'{'):
+            list(iter_object_array(chunks, 'resources'))
+        else:
+            list(iter_array(chunks))
@@ -0,0 +1,69 @@
+import os
+from unittest import mock
+
+import main
+from audit_log import AuditSink
+from change_plan import ApplyCheckpoint
+from change_planner import REPLACE
+from ip_set import IPSet
+from results import IPOutcome, TargetChange
+from snapshot_store import SnapshotStore
+
+
+def stale_site_change():
+    """ An empty source against a site holding 1,200 separate ranges """
+    target_ips = IPSet([f"10.{i // 200}.{i % 200}.1" for i in range(1200)])
+    return TargetChange(
+        'insightvm:200', {'type': 'insightvm', 'site_id': '200'}, IPSet(), target_ips,
+        removals=target_ips, strategy=REPLACE,
+    )
+
+
+def fake_replace(calls, status='success'):
+    def replace(ips, site_id, engine=None, on_success=None, on_outcome=None):
+        calls.append(ips)
+        if status == 'success':
+            on_success(IPSet())
+        on_outcome(IPOutcome(f"site {site_id} (empty target list)", status, 0))
+        return []
+    return replace
+
+
+def test_empty_source_replace_still_sends_put(tmp_path):
+    store = SnapshotStore(os.path.join(tmp_path, 'state.db'))
+    change, audit, calls = stale_site_change(), AuditSink(path=''), []
+    with mock.patch.object(main, 'replace_ips_in_insightvm_site', fake_replace(calls)), \
+            mock.patch.object(main, 'record_applied_changes') as record_applied:
+        main.apply_change(change, store, ApplyCheckpoint(store, {change.key: 'plan'}), audit)
+
+    assert calls == [IPSet()]
+    record_applied.assert_called_once()
+    # A resumed apply does not send the acknowledged PUT again
+    with mock.patch.object(main, 'replace_ips_in_insightvm_site', fake_replace(calls)):
+        main.apply_change(change, store, ApplyCheckpoint(store, {change.key: 'plan'}), audit)
+    assert len(calls) == 1
+    store.close()
+
+
+def test_failed_empty_replace_is_not_clean(tmp_path):
+    store = SnapshotStore(os.path.join(tmp_path, 'state.db'))
+    change, audit, calls = stale_site_change(), AuditSink(path=''), []
+    with mock.patch.object(main, 'replace_ips_in_insightvm_site', fake_replace(calls, 'error')), \
+            mock.patch.object(main, 'record_applied_changes') as record_applied:
+        main.apply_change(change, store, ApplyCheckpoint(store, {change.key: 'plan'}), audit)
+
+    assert calls == [IPSet()]
+    record_applied.assert_not_called()
+    assert not audit.clean()
+    store.close()
+
+
+def test_shodan_replace_counts_addresses(tmp_path):
+    store = SnapshotStore(os.path.join(tmp_path, 'state.db'))
+    source_ips = IPSet(['10.0.0.0/16'])
+    change = TargetChange('shodan:cloud', {'type': 'shodan', 'alert': 'cloud'}, source_ips, IPSet(), additions=source_ips)
+    audit = AuditSink(path='')
+    with mock.patch.object(main, 'replace_ips_in_shodan_net'), mock.patch.object(main, 'record_applied_changes'):
+        assert main.apply_change(change, store, ApplyCheckpoint(store, {change.key: 'plan'}), audit) == (65536, 0)
+    assert audit.summary()[0]['addresses'] == 65536
+    store.close()
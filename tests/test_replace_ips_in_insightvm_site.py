@@ -0,0 +1,48 @@
+from unittest import mock
+
+import get_insightvm_site_contents
+import replace_ips_in_insightvm_site
+from replace_ips_in_insightvm_site import replace_ips_in_insightvm_site as replace_site
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload=None):
+        self.status_code = status_code
+        self.payload = payload or {}
+
+    def json(self):
+        return self.payload
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeSite:
+    def __init__(self, targets):
+        self.targets = targets
+
+    def get(self, path):
+        return FakeResponse(200, {'addresses': list(self.targets)})
+
+    def put(self, path, json=None):
+        self.targets = json
+        return FakeResponse(200)
+
+
+def replace_on(site, ips):
+    with mock.patch.object(replace_ips_in_insightvm_site, 'get_client', return_value=site), \
+            mock.patch.object(get_insightvm_site_contents, 'get_client', return_value=site):
+        return replace_site(ips, '1')
+
+
+def test_replace_keeps_hostname_targets():
+    site = FakeSite(['10.0.0.1', 'scanner.example.com', '10.0.1.0/24', 'db-01'])
+    outcomes = replace_on(site, ['192.0.2.0/30'])
+    assert site.targets == ['192.0.2.0/30', 'scanner.example.com', 'db-01']
+    assert [outcome.status for outcome in outcomes] == ['success']
+
+
+def test_emptying_a_site_keeps_hostname_targets():
+    site = FakeSite(['10.0.0.1', 'scanner.example.com'])
+    replace_on(site, [])
+    assert site.targets == ['scanner.example.com']
@@ -0,0 +1,76 @@
+# filename: write_engine.py
+import os
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+# Chunk writes in flight at once across every target
+WRITE_MAX_WORKERS = int(os.getenv('WRITE_MAX_WORKERS', '8'))
+
+
+class OrderingGuard:
+    """
+    Serializes writes to the same target whose addresses overlap.
+
+    A write holding `ips=None` (such as a full replace) is exclusive on its target. Writes to
+    disjoint addresses of the same target, and writes to different targets, run concurrently.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._in_flight = {}
+
+    def _conflicts(self, key, ips):
+        for other in self._in_flight.get(key, []):
+            if ips is None or other is None or ips & other:
+                return True
+        return False
+
+    @contextmanager
+    def hold(self, key, ips):
+        with self._condition:
+            while self._conflicts(key, ips):
+                self._condition.wait()
+            held = self._in_flight.setdefault(key, [])
+            held.append(ips)
+        try:
+            yield
+        finally:
+            with self._condition:
+                # Remove by identity; equal sets cannot be in flight together anyway
+                for index, other in enumerate(held):
+                    if other is ips:
+                        del held[index]
+                        break
+                self._condition.notify_all()
+
+
+class WriteEngine:
+    """ A bounded worker pool for mutation chunks, with per-target ordering via an OrderingGuard """
+
+    def __init__(self, max_workers=None):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or WRITE_MAX_WORKERS, thread_name_prefix='write')
+        self.guard = OrderingGuard()
+
+    def submit(self, key, ips, func, *args):
+        """ Run func(*args) on the pool once no overlapping write to `key` is in flight """
+        def guarded():
+            with self.guard.hold(key, ips):
+                return func(*args)
+        return self._executor.submit(guarded)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_write_engine():
+    """ The process-wide write engine shared by all writers """
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = WriteEngine()
+        return _engine